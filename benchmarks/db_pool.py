@@ -0,0 +1,83 @@
+"""Concurrent read/write throughput of pfg_param_cache with and without the tuned pool.
+
+Run with ``python -m benchmarks.db_pool`` from the repository root.
+Each run uses a fresh database in a temporary directory.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import asyncio
+import argparse
+import tempfile
+import time
+
+import asqlite
+import orjson
+
+from utils.setup_database import create_pool, setup_db_tables
+
+
+async def _worker(pool: asqlite.Pool, ops: int, users: int, write_ratio: float, seed: int) -> None:
+    rng = random.Random(seed)
+    for _ in range(ops):
+        user_id = rng.randrange(users)
+
+        async with pool.acquire() as conn:
+            if rng.random() < write_ratio:
+                async with conn.transaction():
+                    query = """--sql
+                        INSERT OR REPLACE INTO pfg_param_cache (user_id, damages, ranges, multiplier, rpm)
+                        VALUES (?, ?, ?, ?, ?)
+                    """
+                    await conn.execute(
+                        query, user_id, orjson.dumps([45, 30]), orjson.dumps([50, 100]), 1.0, 600
+                    )
+            else:
+                await conn.fetchone('SELECT * FROM pfg_param_cache WHERE user_id = ?', user_id)
+
+
+async def run(tuned: bool, size: int, workers: int, ops: int, users: int, write_ratio: float) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+
+        if tuned:
+            pool = await create_pool(path, size=size)
+        else:
+            pool = await asqlite.create_pool(path, size=size)
+
+        try:
+            async with pool.acquire() as conn:
+                await setup_db_tables(conn)
+
+            start = time.perf_counter()
+            await asyncio.gather(
+                *(_worker(pool, ops, users, write_ratio, seed) for seed in range(workers))
+            )
+            elapsed = time.perf_counter() - start
+        finally:
+            await pool.close()
+
+    return workers * ops / elapsed
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 4, 10])
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--ops', type=int, default=200, help='Operations per worker.')
+    parser.add_argument('--users', type=int, default=1_000)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(f'{args.workers} workers x {args.ops} ops, {args.write_ratio:.0%} writes')
+    for size in args.sizes:
+        for tuned in (False, True):
+            ops_per_sec = await run(tuned, size, args.workers, args.ops, args.users, args.write_ratio)
+            label = 'tuned' if tuned else 'default'
+            print(f'pool size {size:>3} {label:>8}: {ops_per_sec:10.0f} ops/s')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
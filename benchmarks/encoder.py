@@ -0,0 +1,51 @@
+"""Encode time and output size of the adaptive encoder for a range of upload budgets.
+
+Run with ``python -m benchmarks.encoder`` from the repository root.
+"""
+
+from __future__ import annotations
+
+import timeit
+from io import BytesIO
+from typing import Optional
+
+from PIL import Image
+
+from benchmarks.petpet import avatar_buffer
+from cogs.ukraine import ImageGen
+from cogs.utils.encoder import encode_image, image_filename
+
+MiB = 1024 * 1024
+
+BUDGETS: tuple[Optional[int], ...] = (None, 25 * MiB, 8 * MiB, 1 * MiB, MiB // 4)
+
+
+def png_baseline(img: Image.Image) -> BytesIO:
+    """What the commands saved before, PNG at the default level."""
+    buffer = BytesIO()
+    img.save(buffer, 'png')
+    return buffer
+
+
+def bench(name: str, img: Image.Image, number: int = 3) -> None:
+    def run_baseline() -> BytesIO:
+        return png_baseline(img)
+
+    best = min(timeit.repeat(run_baseline, number=number, repeat=3)) / number
+    print(f'{name} {img.size[0]}px')
+    print(f'  {"png level 6":>14}: {best * 1000:7.1f} ms, {len(run_baseline().getvalue()) / 1024:8.1f} KiB')
+
+    for budget in BUDGETS:
+        def run() -> BytesIO:
+            return encode_image(img, budget)
+
+        best = min(timeit.repeat(run, number=number, repeat=3)) / number
+        data = run().getvalue()
+        label = 'no budget' if budget is None else f'{budget / MiB:g} MiB'
+        print(f'  {label:>14}: {best * 1000:7.1f} ms, {len(data) / 1024:8.1f} KiB as {image_filename("image", data)}')
+
+
+if __name__ == '__main__':
+    avatar = Image.open(avatar_buffer(2048)).convert('RGBA')
+    bench('ukraine', ImageGen(avatar).proportional())
+    bench('gay', avatar.resize((1024, 1024)))
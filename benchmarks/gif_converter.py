@@ -0,0 +1,201 @@
+"""Per-frame cost of the NumPy TransparentAnimatedGifConverter against the original one.
+
+Run with ``python -m benchmarks.gif_converter`` from the repository root.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import timeit
+from collections import defaultdict
+from itertools import chain
+from random import randrange
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from cogs.utils.gif_converter import TransparentAnimatedGifConverter
+
+PET_HAND_PATH = r'./assets/petpet'
+RESOLUTION = 150, 150
+
+
+class LegacyTransparentAnimatedGifConverter:
+    """The original pure Python converter, kept for comparison."""
+
+    _PALETTE_SLOT_SET = set(range(256))
+
+    def __init__(self, img_rgba: Optional[Image.Image] = None, alpha_threshold: int = 0):
+        self._alpha_threshold = alpha_threshold
+        self._img_rgba = img_rgba
+
+        self._palette_replaces = None
+        self._img_p_data = None
+        self._img_p = None
+
+    @property
+    def img_rgba(self):
+        return self._img_rgba
+
+    @img_rgba.setter
+    def img_rgba(self, value):
+        self._img_rgba = value
+
+    def _process_pixels(self) -> None:
+        """Set the transparent pixels to the color 0."""
+        self._transparent_pixels = set(
+            idx
+            for idx, alpha in enumerate(
+                self._img_rgba.getchannel(channel='A').getdata()
+            )
+            if alpha <= self._alpha_threshold
+        )
+
+    def _set_parsed_palette(self) -> None:
+        """Parse the RGB palette color `tuple`s from the palette."""
+        palette = self._img_p.getpalette()
+        self._img_p_used_palette_idxs = set(
+            idx
+            for pal_idx, idx in enumerate(self._img_p_data)
+            if pal_idx not in self._transparent_pixels
+        )
+        self._img_p_parsed_palette = dict(
+            (idx, tuple(palette[idx * 3 : idx * 3 + 3]))
+            for idx in self._img_p_used_palette_idxs
+        )
+
+    def _get_similar_color_idx(self) -> int:
+        """Return a palette index with the closest similar color."""
+        old_color = self._img_p_parsed_palette[0]
+        dict_distance = defaultdict(list)
+        for idx in range(1, 256):
+            color_item = self._img_p_parsed_palette[idx]
+            if color_item == old_color:
+                return idx
+            distance = sum(
+                (
+                    abs(old_color[0] - color_item[0]),  # Red
+                    abs(old_color[1] - color_item[1]),  # Green
+                    abs(old_color[2] - color_item[2]),
+                )
+            )  # Blue
+            dict_distance[distance].append(idx)
+        return dict_distance[sorted(dict_distance)[0]][0]
+
+    def _remap_palette_idx_zero(self) -> None:
+        """Since the first color is used in the palette, remap it."""
+        free_slots = self._PALETTE_SLOT_SET - self._img_p_used_palette_idxs
+        new_idx = free_slots.pop() if free_slots else self._get_similar_color_idx()
+        self._img_p_used_palette_idxs.add(new_idx)
+        self._palette_replaces['idx_from'].append(0)
+        self._palette_replaces['idx_to'].append(new_idx)
+        self._img_p_parsed_palette[new_idx] = self._img_p_parsed_palette[0]
+        del self._img_p_parsed_palette[0]
+
+    def _get_unused_color(self) -> tuple:
+        """Return a color for the palette that does not collide with any other already in the palette.
+        """
+        used_colors = set(self._img_p_parsed_palette.values())
+        while True:
+            new_color = (randrange(256), randrange(256), randrange(256))
+            if new_color not in used_colors:
+                return new_color
+
+    def _process_palette(self) -> None:
+        """Adjust palette to have the zeroth color set as transparent.
+        Basically, get another palette index for the zeroth color.
+        """
+        self._set_parsed_palette()
+        if 0 in self._img_p_used_palette_idxs:
+            self._remap_palette_idx_zero()
+        self._img_p_parsed_palette[0] = self._get_unused_color()
+
+    def _adjust_pixels(self) -> None:
+        """Convert the pixels into their new values."""
+        if self._palette_replaces['idx_from']:
+            trans_table = bytearray.maketrans(
+                bytes(self._palette_replaces['idx_from']),
+                bytes(self._palette_replaces['idx_to']),
+            )
+            self._img_p_data = self._img_p_data.translate(trans_table)
+        for idx_pixel in self._transparent_pixels:
+            self._img_p_data[idx_pixel] = 0
+        self._img_p.frombytes(data=bytes(self._img_p_data))
+
+    def _adjust_palette(self) -> None:
+        """Modify the palette in the new `Image`."""
+        unused_color = self._get_unused_color()
+        final_palette = chain.from_iterable(
+            self._img_p_parsed_palette.get(x, unused_color) for x in range(256)
+        )
+        self._img_p.putpalette(data=final_palette)
+
+    def process(self) -> Image.Image:
+        """Return the processed mode `P` `Image`."""
+        self._img_p = self._img_rgba.convert(mode='P')
+        self._img_p_data = bytearray(self._img_p.tobytes())
+        self._palette_replaces = dict(idx_from=list(), idx_to=list())
+        self._process_pixels()
+        self._process_palette()
+        self._adjust_pixels()
+        self._adjust_palette()
+        self._img_p.info['transparency'] = 0
+        self._img_p.info['background'] = 0
+        return self._img_p
+
+
+def petpet_like_frames() -> list[Image.Image]:
+    """Noisy avatar frames with the pet hand on top, like the ones petpet renders."""
+    rng = np.random.default_rng(0)
+    avatar = Image.fromarray(rng.integers(0, 256, (*RESOLUTION, 4), dtype=np.uint8), 'RGBA')
+
+    frames = []
+    for filename in sorted(os.listdir(PET_HAND_PATH)):
+        hand = Image.open(os.path.join(PET_HAND_PATH, filename)).convert('RGBA').resize(RESOLUTION)
+        canvas = Image.new('RGBA', (RESOLUTION[0] + 10, RESOLUTION[1]), color=(255, 255, 255, 0))
+        canvas.paste(avatar.resize((120, 110)), box=(15, 30))
+        canvas.paste(hand, mask=hand)
+        frames.append(canvas)
+    return frames
+
+
+def _visible(img_p: Image.Image) -> tuple[np.ndarray, np.ndarray]:
+    rgba = np.asarray(img_p.convert('RGBA'))
+    opaque = rgba[..., 3] > 0
+    return opaque, rgba[opaque][:, :3]
+
+
+def check_equivalence(frames: list[Image.Image]) -> None:
+    for frame in frames:
+        expected = LegacyTransparentAnimatedGifConverter(frame, alpha_threshold=15).process()
+        actual = TransparentAnimatedGifConverter(frame, alpha_threshold=15).process()
+
+        # The random colors differ, but what is visible must be the same
+        expected_mask, expected_rgb = _visible(expected)
+        actual_mask, actual_rgb = _visible(actual)
+        assert np.array_equal(expected_mask, actual_mask)
+        assert np.array_equal(expected_rgb, actual_rgb)
+
+    print(f'Equivalence: OK ({len(frames)} frames)')
+
+
+def bench(frames: list[Image.Image]) -> None:
+    for converter_cls in (LegacyTransparentAnimatedGifConverter, TransparentAnimatedGifConverter):
+        converter = converter_cls(alpha_threshold=15)
+
+        def run():
+            for frame in frames:
+                converter.img_rgba = frame
+                converter.process()
+
+        best = min(timeit.repeat(run, number=5, repeat=5)) / 5
+        print(f'{converter_cls.__name__:>40}: {best / len(frames) * 1000:6.2f} ms per frame')
+
+
+if __name__ == '__main__':
+    random.seed(0)
+    frames = petpet_like_frames()
+    check_equivalence(frames)
+    bench(frames)
@@ -0,0 +1,54 @@
+"""Round trip time of image jobs through the process pool, pickled vs shared memory.
+
+Run with ``python -m benchmarks.image_jobs`` from the repository root.
+"""
+
+from __future__ import annotations
+
+import time
+import asyncio
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+
+from cogs.utils.image_jobs import ImageJobRunner
+
+
+def echo(data: memoryview) -> BytesIO:
+    """A job that does no work, so only the transport is measured."""
+    return BytesIO(data)
+
+
+def echo_pickled(data: bytes) -> BytesIO:
+    return BytesIO(data)
+
+
+async def bench(sizes: list[int], number: int = 50) -> None:
+    loop = asyncio.get_running_loop()
+
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        runner = ImageJobRunner(executor)
+
+        for size in sizes:
+            data = bytes(size)
+
+            # Warm up the workers and the segment pool
+            await runner.run(echo, data)
+            await loop.run_in_executor(executor, echo_pickled, data)
+
+            start = time.perf_counter()
+            for _ in range(number):
+                await loop.run_in_executor(executor, echo_pickled, data)
+            pickled = (time.perf_counter() - start) / number
+
+            start = time.perf_counter()
+            for _ in range(number):
+                await runner.run(echo, data, output_size=size)
+            shared = (time.perf_counter() - start) / number
+
+            print(f'{size / 1024 / 1024:5.1f} MiB: pickled {pickled * 1000:6.2f} ms, shared {shared * 1000:6.2f} ms')
+
+        runner.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(bench([256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 12 * 1024 * 1024]))
@@ -0,0 +1,51 @@
+"""Encode time and output size of petpets for each output format.
+
+Run with ``python -m benchmarks.petpet`` from the repository root.
+"""
+
+from __future__ import annotations
+
+import timeit
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from cogs.petpet import PetPetCreator
+
+
+def avatar_buffer(size: int = 512) -> BytesIO:
+    """A smooth gradient avatar with some noise, closer to a real avatar than pure noise."""
+    rng = np.random.default_rng(0)
+    x, y = np.meshgrid(np.linspace(0, 255, size), np.linspace(0, 255, size))
+    rgb = np.stack((x, y, 255 - x), axis=-1) + rng.normal(0, 12, (size, size, 3))
+
+    buffer = BytesIO()
+    Image.fromarray(rgb.clip(0, 255).astype(np.uint8)).save(buffer, 'png')
+    return buffer
+
+
+def bench(modes: dict[str, dict], number: int = 5) -> None:
+    source = avatar_buffer().getvalue()
+
+    for name, kwargs in modes.items():
+        kwargs = kwargs.copy()
+        format = kwargs.pop('format', 'gif')
+
+        def run() -> BytesIO:
+            return PetPetCreator(BytesIO(source), **kwargs).create(format)
+
+        best = min(timeit.repeat(run, number=number, repeat=3)) / number
+        size = len(run().getvalue())
+        print(f'{name:>16}: {best * 1000:7.2f} ms, {size / 1024:7.1f} KiB')
+
+
+if __name__ == '__main__':
+    bench({
+        'gif': dict(),
+        'webp-q80-m0': dict(format='webp'),
+        'webp-q80-m4': dict(format='webp', method=4),
+        'webp-q60-m0': dict(format='webp', quality=60),
+        'webp-lossless-m0': dict(format='webp', lossless=True),
+        'webp-lossless-m4': dict(format='webp', lossless=True, method=4),
+    })
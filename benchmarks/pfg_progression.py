@@ -0,0 +1,41 @@
+"""Benchmark for the vectorized pfg progression engine.
+
+Run with ``python -m benchmarks.pfg_progression`` from the repository root.
+Equivalence with the pure Python path is tested in ``tests/test_pfg_progression.py``.
+"""
+
+from __future__ import annotations
+
+import random
+import timeit
+
+from cogs.utils.pfg_engine import PfgCalculator
+from tests.test_pfg_progression import random_params
+
+
+def _outcome(func):
+    try:
+        return func()
+    except Exception as e:
+        return type(e)
+
+
+def bench(samples: int = 1_000, seed: int = 1) -> None:
+    rng = random.Random(seed)
+    calcs = []
+    while len(calcs) < samples:
+        calc = PfgCalculator(*random_params(rng))
+        if not isinstance(_outcome(calc.calculate_progression), type):
+            calcs.append(calc)
+
+    timings = {
+        'single': lambda: [calc.calculate_progression() for calc in calcs],
+        'batched': lambda: PfgCalculator.calculate_progressions(calcs),
+    }
+    for name, func in timings.items():
+        best = min(timeit.repeat(func, number=1, repeat=5))
+        print(f'{name:>10}: {best * 1000:8.2f} ms for {samples} configs')
+
+
+if __name__ == '__main__':
+    bench()
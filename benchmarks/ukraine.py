@@ -0,0 +1,44 @@
+"""Per-request render time of the Ukraine ring for a range of avatar sizes.
+
+Cold is the first render at a size, before its masks are cached.
+Run with ``python -m benchmarks.ukraine`` from the repository root.
+"""
+
+from __future__ import annotations
+
+import time
+import timeit
+from io import BytesIO
+from typing import Optional
+
+from PIL import Image
+
+from benchmarks.petpet import avatar_buffer
+from cogs.ukraine import ImageGen
+
+
+def render(avatar: bytes, size: Optional[int] = None) -> Image.Image:
+    """The render part of ``Ukraine._get_buffer``, without encoding."""
+    img = Image.open(BytesIO(avatar))
+    if size is not None and max(img.size) > size:
+        img.thumbnail((size, size), Image.LANCZOS)
+    return ImageGen(img).proportional()
+
+
+def bench(avatar_size: int, size: Optional[int] = None, number: int = 3) -> None:
+    avatar = avatar_buffer(avatar_size).getvalue()
+
+    start = time.perf_counter()
+    render(avatar, size)
+    cold = time.perf_counter() - start
+
+    best = min(timeit.repeat(lambda: render(avatar, size), number=number, repeat=3)) / number
+    label = f'{avatar_size}px' + (f' at {size}px' if size else '')
+    print(f'{label:>16}: cold {cold * 1000:7.1f} ms, cached {best * 1000:7.1f} ms')
+
+
+if __name__ == '__main__':
+    for avatar_size in (512, 1024, 2048):
+        bench(avatar_size)
+    for size in (1024, 512):
+        bench(2048, size)
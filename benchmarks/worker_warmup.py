@@ -0,0 +1,57 @@
+"""Latency of the first renders in a fresh process pool, with and without the warm initializer.
+
+Run with ``python -m benchmarks.worker_warmup`` from the repository root.
+"""
+
+from __future__ import annotations
+
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.petpet import avatar_buffer
+from cogs.petpet import PetPet
+from cogs.ukraine import Ukraine
+from cogs.utils.image_jobs import IMAGE_MODULES, ImageJobRunner, init_worker
+
+JOBS = {
+    'petpet': PetPet._get_buffer,
+    'ukraine': Ukraine._get_buffer,
+}
+
+
+async def first_requests(context: str, warm: bool, requests: int = 3) -> dict[str, list[float]]:
+    kwargs = dict(initializer=init_worker, initargs=(IMAGE_MODULES,)) if warm else {}
+    executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context(context), **kwargs)
+    runner = ImageJobRunner(executor)
+    source = avatar_buffer(1024).getvalue()
+
+    if warm:
+        await runner.warm_up(1)
+
+    timings = {}
+    for name, func in JOBS.items():
+        timings[name] = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            await runner.run(func, source)
+            timings[name].append(time.perf_counter() - start)
+
+    runner.close()
+    executor.shutdown()
+    return timings
+
+
+async def bench() -> None:
+    for context in ('fork', 'spawn'):
+        for warm in (False, True):
+            timings = await first_requests(context, warm)
+            label = f'{context}, {"warm" if warm else "cold"}'
+            for name, samples in timings.items():
+                fmt = ' '.join(f'{sample * 1000:7.1f}' for sample in samples)
+                print(f'{label:>11} {name:>8}: {fmt} ms')
+
+
+if __name__ == '__main__':
+    asyncio.run(bench())
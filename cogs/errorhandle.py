@@ -9,6 +9,7 @@ from typing import TYPE_CHECKING
 
 # Custom errors
 from cogs.mp3 import FileTooBig
+from cogs.utils.render_scheduler import RenderBusy
 from asyncprawcore.exceptions import AsyncPrawcoreException
 
 if TYPE_CHECKING:
@@ -79,6 +80,9 @@ class ErrorHandler(commands.Cog):
         #     await ctx.reply(f':no_entry_sign: `{ctx.command}` has been disabled.', ephemeral=True)
         #     return
 
+        elif isinstance(error, RenderBusy):
+            return await ctx.reply(f':hourglass: {error}', delete_after=10, ephemeral=True)
+
         elif isinstance(error, commands.NoPrivateMessage):
             try:
                 return await ctx.author.send(f':no_entry_sign: `{ctx.command}` can\'t be used in Private Messages.')
@@ -1,12 +1,14 @@
 from __future__ import annotations
 
-import discord
 from discord.ext import commands
 
-import os
 import io
 from PIL import Image
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
+from cogs.utils.cache import LRUCache
+from cogs.utils.encoder import encode_image
+from cogs.utils.image_cache import render_cached
+from cogs.utils.image_jobs import sample_image
 
 if TYPE_CHECKING:
     from main import MoistBot
@@ -15,11 +17,34 @@ if TYPE_CHECKING:
 
 overlay = Image.open('./assets/pride.png').convert('RGBA')
 
+# Size of avatars fetched without an explicit size
+AVATAR_SIZE = 1024, 1024
+
+# Resized overlays of this process by target size
+_overlays: LRUCache[tuple[int, int], Image.Image] = LRUCache(8)
+
+
+def get_overlay(size: tuple[int, int]) -> Image.Image:
+    """Returns the overlay resized to the size, resizing it only once per process."""
+    overlay_sized = _overlays.get(size)
+    if overlay_sized is None:
+        overlay_sized = overlay.resize(size, Image.BICUBIC)
+        _overlays.set(size, overlay_sized)
+    return overlay_sized
+
 
 class Gay(commands.Cog):
     def __init__(self, client: MoistBot):
         self.client: MoistBot = client
 
+    @staticmethod
+    def _get_buffer(img_bytes: memoryview, opacity: float, max_bytes: Optional[int] = None) -> io.BytesIO:
+        img = Image.open(io.BytesIO(img_bytes))
+        img = img.convert('RGBA')
+
+        blend = Image.blend(img, get_overlay(img.size), opacity)
+        return encode_image(blend, max_bytes)
+
     @commands.command()
     async def gay(self, ctx: Context, user: str = None, opacity: str = None):
         """Show your gay pride!
@@ -42,21 +67,18 @@ class Gay(commands.Cog):
         elif opacity is None:
             opacity = 0.4
 
-        img = await user_conv.avatar.read()
+        asset = user_conv.avatar
 
         # Image stuff uwu
-        img = Image.open(io.BytesIO(img))
-        img = img.convert('RGBA')
+        file = await render_cached(ctx, 'gay', asset, self._get_buffer, opacity, stem='img')
 
-        global overlay
-        overlay_sized = overlay.resize(img.size, Image.BICUBIC)
+        # Send image
+        await ctx.reply(file=file)
 
-        blend = Image.blend(img, overlay_sized, opacity)
-        blend.save('./assets/img.png', 'PNG')
 
-        # Send image
-        await ctx.reply(file=discord.File('./assets/img.png'))
-        os.remove('./assets/img.png')
+def warm_worker() -> None:
+    Gay._get_buffer(sample_image(), 0.4)
+    get_overlay(AVATAR_SIZE)
 
 
 async def setup(client: MoistBot) -> None:
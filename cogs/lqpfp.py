@@ -5,53 +5,74 @@ from discord.ext import commands
 
 import io
 from PIL import Image
-from typing import TYPE_CHECKING
-from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Optional
+from cogs.utils.encoder import encode_image
+from cogs.utils.image_cache import render_cached
+from cogs.utils.image_jobs import sample_image
 
 if TYPE_CHECKING:
     from main import MoistBot
     from cogs.utils.context import Context
 
 
+# Side of the pixel grid at factor 1, relative to a 2048px avatar
+LQ_RATIO = 15 / 100
+REFERENCE_SIZE = 2048
+
+# Sizes the CDN can serve avatars at
+AVATAR_SIZES = (16, 32, 64, 128, 256, 512, 1024, 2048)
+
+# The output is scaled up by a whole number to at least this size
+MIN_OUTPUT_SIZE = 512
+
+
+def grid_size(factor: float) -> int:
+    """Number of pixels along each side of the low quality avatar."""
+    return round(LQ_RATIO * REFERENCE_SIZE / factor) or 1
+
+
+def avatar_size(factor: float) -> int:
+    """Smallest avatar size with at least one pixel for every pixel of the grid."""
+    lq_size = grid_size(factor)
+    return next((size for size in AVATAR_SIZES if size >= lq_size), AVATAR_SIZES[-1])
+
+
 class AvatarEmbed(discord.Embed):
     def __init__(
         self,
         user: discord.User,
+        filename: str = 'image.png',
     ):
         super().__init__(
             type='image',
             color=user.accent_color or discord.Color.random(),
         )
-        self.set_image(url='attachment://image.png')
+        self.set_image(url=f'attachment://{filename}')
         self.set_author(
             name=f"{user.display_name}'s low quality avatar",
-            icon_url='attachment://image.png'
+            icon_url=f'attachment://{filename}'
         )
 
 
 class LowQualityProfilePicture(commands.Cog):
     def __init__(self, client: MoistBot):
         self.client: MoistBot = client
-        self.executor = ProcessPoolExecutor()
-        self.execute = self.client.loop.run_in_executor
-
-    async def cog_unload(self) -> None:
-        self.executor.shutdown(wait=False)
 
     @staticmethod
-    def _get_buffer(img_bytes: bytes, lq_f: float = 1) -> io.BytesIO:
-        img = Image.open(io.BytesIO(img_bytes))
+    def _get_buffer(img_bytes: memoryview, lq_f: float = 1, max_bytes: Optional[int] = None) -> io.BytesIO:
+        img = Image.open(io.BytesIO(img_bytes)).convert('RGBA')
 
-        s, _ = org_size = img.size
-        lq_size = round((15/100 * s) / lq_f) or 1
+        lq_size = grid_size(lq_f)
+        img = img.resize((lq_size, lq_size), Image.NEAREST)
 
-        img = img.resize((lq_size, lq_size), Image.NONE)
-        img = img.resize(org_size, Image.NONE)
+        # Few pixels means few colors, a palette image is a fraction of the size to encode
+        img = img.quantize(256, method=Image.Quantize.FASTOCTREE)
 
-        buffer = io.BytesIO()
-        img.save(buffer, 'png')
-        buffer.seek(0)
-        return buffer
+        # Whole number scaling keeps every pixel the same size
+        scale = -(-MIN_OUTPUT_SIZE // lq_size)
+        img = img.resize((lq_size * scale, lq_size * scale), Image.NEAREST)
+
+        return encode_image(img, max_bytes)
 
     @commands.cooldown(rate=1, per=2, type=commands.BucketType.user)
     @commands.command()
@@ -68,21 +89,18 @@ class LowQualityProfilePicture(commands.Cog):
             raise commands.BadArgument('Size must be between 1 and 999999999')
 
         async with ctx.typing():
-            try:
-                # Get avatar
-                avatar: bytes = await user.display_avatar.with_format('png').with_size(2048).read()
+            # Heavier factors need fewer pixels
+            asset = user.display_avatar.with_format('png').with_size(avatar_size(factor))
+
+            # Reuse the image if this avatar was already made low quality by this factor
+            file = await render_cached(ctx, 'lqpfp', asset, self._get_buffer, factor)
 
-                # Avoid blocking
-                img_buffer = await self.execute(self.executor, self._get_buffer, avatar, factor)
+            # Send image
+            await ctx.reply(file=file, embed=AvatarEmbed(user, file.filename))  # type: ignore
 
-                # Send image
-                file = discord.File(fp=img_buffer, filename='image.png')
-                await ctx.reply(file=file, embed=AvatarEmbed(user))
 
-            finally:
-                # Free memory
-                img_buffer.close()
-                del img_buffer, avatar
+def warm_worker() -> None:
+    LowQualityProfilePicture._get_buffer(sample_image())
 
 
 async def setup(client: MoistBot) -> None:
@@ -346,6 +346,9 @@ class OwnerOnly(commands.Cog):
         elif isinstance(error, commands.MissingRequiredFlag):
             await ctx.reply(f':warning: {str(error)}')
 
+        elif isinstance(error, commands.BadArgument):
+            await ctx.reply(str(error))
+
         elif isinstance(error, discord.HTTPException):
             logger.exception('Unable to add sticker', exc_info=error.__traceback__)
             await ctx.reply(':warning: Unable to resolve sticker')
@@ -605,6 +608,15 @@ class OwnerOnly(commands.Cog):
             inline=False
         )
 
+        embed.add_field(name='Renders', value=str(self.client.render_scheduler.stats), inline=False)
+
+        if self.client.caches:
+            embed.add_field(
+                name='Caches',
+                value='\n'.join(f'{name}: {cache.stats}' for name, cache in self.client.caches.items()),
+                inline=False
+            )
+
         description = []
 
         started_at = discord.utils.format_dt(self.client.started_at, 'R')
@@ -5,11 +5,15 @@ from discord import app_commands
 from discord.ext import commands
 
 import os
+from functools import partial
 from io import BytesIO
-from typing import TYPE_CHECKING, Union
+from typing import TYPE_CHECKING, Literal, NamedTuple, Optional, Union
 
 from PIL import Image, ImageDraw
+from cogs.utils.converters import max_media_size, read_attachment
 from cogs.utils.gif_converter import TransparentAnimatedGifConverter
+from cogs.utils.image_cache import render_cached
+from cogs.utils.image_jobs import sample_image
 
 if TYPE_CHECKING:
     from main import MoistBot
@@ -18,8 +22,21 @@ if TYPE_CHECKING:
 
 PET_HAND_PATH = r'./assets/petpet'
 RESOLUTION = 150, 150
+FRAME_SIZE = RESOLUTION[0] + 10, RESOLUTION[1]
+ALPHA_THRESHOLD = 15
+
+# Animated sources are only decoded up to this frame
+MAX_SOURCE_FRAMES = 120
+
+OutputFormat = Literal['gif', 'webp']
+DEFAULT_FORMAT: OutputFormat = 'gif'
+
+# Lossy WebP with the fastest method, see benchmarks/petpet.py
+WEBP_QUALITY = 80
+WEBP_METHOD = 0
+
 PET_HAND_FRAMES = []
-for pet_img in os.listdir(PET_HAND_PATH):
+for pet_img in sorted(os.listdir(PET_HAND_PATH)):
     pet_img = (
         Image.open(os.path.join(PET_HAND_PATH, pet_img))
         .convert('RGBA')
@@ -28,71 +45,164 @@ for pet_img in os.listdir(PET_HAND_PATH):
     PET_HAND_FRAMES.append(pet_img)
 
 
+class FrameLayout(NamedTuple):
+    size: tuple[int, int]
+    box: tuple[int, int]
+
+
+def _frame_layouts(frame_count: int) -> list[FrameLayout]:
+    """Size and position of the squeezed base image in every frame."""
+    x, y = RESOLUTION
+    layouts = []
+    for i in range(frame_count):
+        squeeze = i if i < frame_count / 2 else frame_count - i
+
+        width = 0.8 + squeeze * 0.02
+        height = 0.8 - squeeze * 0.05
+        offsetX = (1 - width) * 0.5 + 0.1
+        offsetY = (1 - height) - 0.08
+
+        new_size = round(width * x), round(height * y)
+        box = round(offsetX * x), round(offsetY * y)
+        layouts.append(FrameLayout(new_size, box))
+    return layouts
+
+
 class PetPetCreator:
     _pet_hand_frames = PET_HAND_FRAMES
+    _layouts = _frame_layouts(len(PET_HAND_FRAMES))
     _converter: TransparentAnimatedGifConverter
     _base_img: Image.Image
     gif_buffer: BytesIO
+    webp_buffer: BytesIO
 
-    def __init__(self, image_buffer: BytesIO) -> None:
+    def __init__(
+        self,
+        image_buffer: BytesIO,
+        *,
+        animated: bool = True,
+        lossless: bool = False,
+        quality: int = WEBP_QUALITY,
+        method: int = WEBP_METHOD,
+    ) -> None:
         self._image_buffer = image_buffer
+        self.animated = animated
+
+        # WebP only
+        self.lossless = lossless
+        self.quality = quality
+        self.method = method
 
         self.resolution = RESOLUTION
         self.max_frames = len(self._pet_hand_frames)
         self.frames: list[Image.Image] = []
 
+    def create(self, format: OutputFormat = DEFAULT_FORMAT, max_bytes: Optional[int] = None) -> BytesIO:
+        """Creates the petpet from the image buffer in the given format.
+
+        A GIF over ``max_bytes`` is encoded again as a WebP from the same frames.
+        """
+        if format == 'webp':
+            return self.create_webp()
+
+        buffer = self.create_gif()
+        if max_bytes is not None and buffer.getbuffer().nbytes > max_bytes:
+            return self.create_webp()
+        return buffer
+
     def create_gif(self) -> BytesIO:
         """Creates the gif from the image buffer."""
 
-        # Load the image from the buffer and set it up
-        self._base_img = Image.open(self._image_buffer)
-        self._base_img = self._base_img.convert('RGBA').resize(self.resolution)
-
         # Init
-        self._converter = TransparentAnimatedGifConverter(alpha_threshold=15)
+        self._converter = TransparentAnimatedGifConverter(alpha_threshold=ALPHA_THRESHOLD)
         self.gif_buffer = BytesIO()
 
-        # Round corners of base image
-        x, y = self.resolution
-        mask = self._gen_mask(start_size=(x * 4, y * 4), final_size=self.resolution)
-        canvas = Image.new('RGBA', self.resolution, color=(128, 128, 128, 0))
-        self._base_img = Image.composite(self._base_img, canvas, mask=mask)
-
         # Process and render
-        self._process_frames()
+        self._load_frames()
         self._render_gif()
 
         return self.gif_buffer
 
-    def _process_frames(self) -> None:
-        for i in range(self.max_frames):
-            squeeze = i if i < self.max_frames / 2 else self.max_frames - i
+    def create_webp(self) -> BytesIO:
+        """Creates an animated WebP from the image buffer.
 
-            width = 0.8 + squeeze * 0.02
-            height = 0.8 - squeeze * 0.05
-            offsetX = (1 - width) * 0.5 + 0.1
-            offsetY = (1 - height) - 0.08
+        WebP keeps the alpha channel, so the RGBA frames are encoded as they are
+        without quantizing them.
+        """
+        self.webp_buffer = BytesIO()
 
-            x, y = self.resolution
-            new_size = round(width * x), round(height * y)
-            box = round(offsetX * x), round(offsetY * y)
+        self._load_frames()
+        self._render_webp()
 
-            new_img = self._base_img.resize(new_size)
-            canvas = Image.new('RGBA', size=(x + 10, y), color=(255, 255, 255, 0))
-            canvas.paste(new_img, box=box)
+        return self.webp_buffer
 
-            pat_hand = self._pet_hand_frames[i]
+    def _load_frames(self) -> None:
+        # Already loaded for another format
+        if self.frames:
+            return
 
-            canvas.paste(pat_hand, mask=pat_hand)
-            self.frames.append(canvas)
+        # Load the image from the buffer
+        source = Image.open(self._image_buffer)
 
-    def _render_gif(self, durations: Union[int, list[int]] = 20) -> None:
-        new_frames: list[Image.Image] = []
+        if self.animated and getattr(source, 'is_animated', False):
+            self._process_animated_frames(source)
+        else:
+            self._base_img = self._prepare_base(source)
+            self._process_frames()
+
+    def _prepare_base(self, img: Image.Image) -> Image.Image:
+        img = img.convert('RGBA').resize(self.resolution)
 
+        # Round corners of base image
+        return Image.composite(img, BASE_BACKGROUND, mask=ROUND_MASK)
+
+    @staticmethod
+    def _compose_frame(new_img: Image.Image, box: tuple[int, int], pat_hand: Image.Image) -> Image.Image:
+        canvas = BLANK_FRAME.copy()
+        canvas.paste(new_img, box=box)
+
+        canvas.paste(pat_hand, mask=pat_hand)
+        return canvas
+
+    def _process_frames(self) -> None:
+        # Frames squeezed by the same amount share a size
+        resized: dict[tuple[int, int], Image.Image] = {}
+
+        for (new_size, box), pat_hand in zip(self._layouts, self._pet_hand_frames):
+            new_img = resized.get(new_size)
+            if new_img is None:
+                new_img = resized[new_size] = self._base_img.resize(new_size)
+
+            self.frames.append(self._compose_frame(new_img, box, pat_hand))
+
+    def _source_indices(self, n_frames: int) -> list[int]:
+        """The source frame shown in each pet frame, playing the source animation once per pet loop."""
+        n_frames = min(n_frames, MAX_SOURCE_FRAMES)
+        return [i * n_frames // self.max_frames for i in range(self.max_frames)]
+
+    def _process_animated_frames(self, source: Image.Image) -> None:
+        # Source frames are decoded in order, only the current one is kept
+        current = -1
+        for (new_size, box), pat_hand, index in zip(
+            self._layouts, self._pet_hand_frames, self._source_indices(source.n_frames)  # type: ignore
+        ):
+            if index != current:
+                source.seek(index)
+                self._base_img = self._prepare_base(source)
+                current = index
+
+            self.frames.append(self._compose_frame(self._base_img.resize(new_size), box, pat_hand))
+
+    def _quantize_frames(self) -> list[Image.Image]:
+        new_frames: list[Image.Image] = []
         for frame in self.frames:
             self._converter.img_rgba = frame
             frame_p = self._converter.process()
             new_frames.append(frame_p)
+        return new_frames
+
+    def _render_gif(self, durations: Union[int, list[int]] = 20) -> None:
+        new_frames = self._quantize_frames()
 
         output_image = new_frames[0]
         output_image.save(
@@ -107,6 +217,23 @@ class PetPetCreator:
         )
         self.gif_buffer.seek(0)
 
+    def _render_webp(self, durations: Union[int, list[int]] = 20) -> None:
+        self.frames[0].save(
+            self.webp_buffer,
+            format='WEBP',
+            save_all=True,
+            append_images=self.frames[1:],
+            duration=durations,
+            loop=0,
+            lossless=self.lossless,
+            quality=self.quality,
+            method=self.method,
+            # Only the first frame is a keyframe, saves encoding every frame twice to pick one
+            kmin=0,
+            kmax=0,
+        )
+        self.webp_buffer.seek(0)
+
     @staticmethod
     def _gen_mask(
         *,
@@ -127,29 +254,63 @@ class PetPetCreator:
         return mask
 
 
+# Static parts of every petpet
+ROUND_MASK = PetPetCreator._gen_mask(
+    start_size=(RESOLUTION[0] * 4, RESOLUTION[1] * 4), final_size=RESOLUTION
+)
+BASE_BACKGROUND = Image.new('RGBA', RESOLUTION, color=(128, 128, 128, 0))
+BLANK_FRAME = Image.new('RGBA', FRAME_SIZE, color=(255, 255, 255, 0))
+
+
 class PetPetEmbed(discord.Embed):
     def __init__(
         self,
         user: discord.User,
+        filename: str = 'petpet.gif',
     ):
         super().__init__(
             color=user.accent_color or discord.Color.random(),
             type='image',
         )
-        self.set_image(url='attachment://petpet.gif')
+        self.set_image(url=f'attachment://{filename}')
         self.set_author(
-            name=f'{user.display_name}\'s petpet', icon_url='attachment://petpet.gif'
+            name=f'{user.display_name}\'s petpet', icon_url=f'attachment://{filename}'
         )
 
 
 class PetPet(commands.Cog):
     def __init__(self, client: MoistBot):
         self.client: MoistBot = client
-        self.execute = self.client.loop.run_in_executor
+
+        # Output format of every guild that changed it
+        self.formats: dict[int, OutputFormat] = {}
+
+    async def cog_load(self) -> None:
+        async with self.client.pool.acquire() as conn:
+            async with conn:
+                query = """--sql
+                    SELECT guild_id, petpet_format
+                    FROM guild_settings
+                    WHERE petpet_format != ?
+                """
+                rows = await conn.fetchall(query, DEFAULT_FORMAT)
+
+        self.formats = {row['guild_id']: row['petpet_format'] for row in rows}
 
     @staticmethod
-    def _get_buffer(img_buffer: BytesIO):
-        return PetPetCreator(img_buffer).create_gif()
+    def _get_buffer(
+        img_bytes: memoryview, format: OutputFormat = DEFAULT_FORMAT, max_bytes: Optional[int] = None
+    ) -> BytesIO:
+        return PetPetCreator(BytesIO(img_bytes)).create(format, max_bytes)
+
+    async def _read_attachment(self, attachment: discord.Attachment) -> Optional[memoryview]:
+        media = await read_attachment(self.client.session, attachment, max_size=max_media_size(self.client))
+        return media.getbuffer() if media is not None else None
+
+    def get_format(self, guild: Optional[discord.Guild]) -> OutputFormat:
+        if guild is None:
+            return DEFAULT_FORMAT
+        return self.formats.get(guild.id, DEFAULT_FORMAT)
 
     @commands.cooldown(rate=1, per=4, type=commands.BucketType.user)
     @app_commands.describe(user='The target user.')
@@ -158,25 +319,60 @@ class PetPet(commands.Cog):
         await ctx.typing()
 
         reply = ctx.replied_message
-        img_buffer = BytesIO()
 
-        # Fetch image bytes
         # Order of priority: specified user -> attachment -> reply attachment -> author
+        source: Union[discord.Asset, discord.Attachment]
         if user != ctx.author:
-            await user.display_avatar.with_format('png').save(fp=img_buffer)
+            source = user.display_avatar
         elif ctx.message.attachments:
-            await ctx.message.attachments[0].save(fp=img_buffer, use_cached=True)
+            source = ctx.message.attachments[0]
         elif reply and reply.attachments:
-            await reply.attachments[0].save(fp=img_buffer, use_cached=True)
+            source = reply.attachments[0]
         else:
-            await user.display_avatar.with_format('png').save(fp=img_buffer)
+            source = user.display_avatar
 
-        # Avoid blocking
-        img_buffer = await self.execute(self.client.executor, self._get_buffer, img_buffer)
+        if isinstance(source, discord.Asset):
+            # Animated avatars keep their animation, small since they're decoded frame by frame
+            source = source.with_format('gif').with_size(256) if source.is_animated() else source.with_format('png')
+
+        # Attachments are downloaded with a size cap, avatars go through the avatar cache
+        fetch = partial(self._read_attachment, source) if isinstance(source, discord.Attachment) else None
+
+        # Same image, same petpet
+        format = self.get_format(ctx.guild)
+        file = await render_cached(ctx, 'petpet', source, self._get_buffer, format, stem='petpet', fetch=fetch)
+        if file is None:
+            return await ctx.reply(':warning: Missing image.', ephemeral=True)
 
         # Send image
-        file = discord.File(fp=img_buffer, filename='petpet.gif')
-        await ctx.reply(file=file, embed=PetPetEmbed(user))
+        await ctx.reply(file=file, embed=PetPetEmbed(user, file.filename))
+
+    @commands.guild_only()
+    @commands.has_guild_permissions(manage_guild=True)
+    @app_commands.describe(format='GIF works everywhere, WebP is smaller and keeps smooth edges.')
+    @commands.hybrid_command(name='petpet-format', description='Set the petpet format of this server')
+    async def petpet_format(self, ctx: Context, format: OutputFormat):
+        async with self.client.pool.acquire() as conn:
+            async with conn.transaction():
+                query = """--sql
+                    INSERT INTO guild_settings (guild_id, petpet_format)
+                    VALUES (?, ?)
+                    ON CONFLICT (guild_id) DO UPDATE SET petpet_format = excluded.petpet_format
+                """
+                await conn.execute(query, ctx.guild.id, format)  # type: ignore
+
+        if format == DEFAULT_FORMAT:
+            self.formats.pop(ctx.guild.id, None)
+        else:
+            self.formats[ctx.guild.id] = format
+
+        await ctx.reply(f':white_check_mark: Petpets in this server are now sent as `{format}`.')
+
+
+def warm_worker() -> None:
+    """Renders a tiny petpet so the first real one in a worker doesn't pay for lazy initialization."""
+    PetPet._get_buffer(sample_image(), 'gif')
+    PetPet._get_buffer(sample_image(), 'webp')
 
 
 async def setup(client: MoistBot) -> None:
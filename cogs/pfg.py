@@ -1,17 +1,15 @@
 from __future__ import annotations
 
 import re
+import asyncio
+import logging
 from typing import (
     TYPE_CHECKING,
     NamedTuple,
     Annotated,
-    TypeAlias,
     Optional,
     Sequence,
-    overload,
-    Literal,
     Union,
-    Self
 )
 
 import orjson
@@ -19,6 +17,13 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 
+from cogs.pfgun_utils.SheetReader import GunIndex, get_gun_params, get_index, normalize_gun
+from cogs.utils.cache import LRUCache
+from cogs.utils.float_blobs import pack_floats, unpack_floats
+from cogs.utils.pfg_engine import N, PfgCalculator, PfgParams, PfgPoint, remove_decimal
+from cogs.utils.trie import PrefixTrie
+from cogs.utils.write_buffer import WriteBehindBuffer
+
 if TYPE_CHECKING:
     import sqlite3
 
@@ -26,26 +31,14 @@ if TYPE_CHECKING:
     from utils.context import Context
 
 
-N: TypeAlias = Union[int, float]
-G: TypeAlias = Literal[1, -1, 0]
-shots_to_damage: dict[int, N] = {
-    1: 100,
-    2: 50,
-    3: 33.34,
-    4: 25,
-    5: 20,
-    6: 16.67,
-    7: 14.29,
-    8: 12.5,
-    9: 11.12,
-    10: 10,
-    11: 9.1,
-    12: 8.34,
-}
+logger = logging.getLogger('discord.' + __name__)
 
 
 FLOAT_REGEX = re.compile(r'[-+]?[0-9]*\.?[0-9]+')
 
+AUTOCOMPLETE_LIMIT = 25  # Max choices Discord accepts
+AUTOCOMPLETE_DEBOUNCE = 0.15  # Seconds to wait for a newer keystroke
+
 NO_PREV_DATA_EMBED = discord.Embed(
     title=':x: Error',
     description='No previous command has been run.',
@@ -53,23 +46,9 @@ NO_PREV_DATA_EMBED = discord.Embed(
 )
 
 
-@overload
-def remove_decimal(number: int, ndigits: int = 2) -> int:
-    ...
-
-
-@overload
-def remove_decimal(number: float, ndigits: int = 2) -> N:
-    ...
-
-
-def remove_decimal(number: N, ndigits: int = 2) -> N:
-    if isinstance(number, int):
-        return number
-    elif number.is_integer():
-        return int(number)
-    else:
-        return round(number, ndigits)
+def is_shotgun(params: dict) -> bool:
+    """Shotguns list their damage per pellet, which pfg can't calculate."""
+    return 'x' in params['close_damage'] or 'x' in params['long_damage']
 
 
 class FloatSequenceTransformer(app_commands.Transformer):
@@ -86,198 +65,33 @@ class PfgFlags(commands.FlagConverter, prefix='', delimiter='=', case_insensitiv
 # fmt: on
 
 
-class PfgPoint(NamedTuple):
-    shots: int
-    range: N
-    ttk: Optional[N]
-
-
-class PfgCalculator:
-    shots_to_damage = shots_to_damage
-
+class PfgEmbed(discord.Embed):
     def __init__(
         self,
-        damages: Sequence[N],
-        ranges: Sequence[N],
+        data_points: Sequence[PfgPoint],
         multiplier: N,
         rpm: Optional[N] = None,
-    ):
-        d_len, r_len = len(damages), len(ranges)
-        if d_len != r_len:
-            raise ValueError('Damages and ranges must be the same length.')
-        elif d_len < 2:
-            raise ValueError('At least two data points are required.')
-
-        self.damages: Sequence[N] = damages
-        self.ranges: Sequence[N] = ranges
-        self.multiplier: N = multiplier
-        self.rpm: Optional[N] = rpm
-
-        # Apply multiplier
-        self.damages = [damage * self.multiplier for damage in damages]
-
-        # Create data points
-        self.data_points: Sequence[tuple[N, N]] = tuple(zip(self.damages, self.ranges))
-        self.len_data_points = d_len  # Since damages and ranges are the same length
-
-        # Precompute max values
-        self._max_damage = max(self.damages)
-        self._max_range = max(self.ranges)
-
-    @classmethod
-    def from_pfg_args(cls, args: PfgFlags) -> Self:
-        return cls(args.damages, args.ranges, args.multiplier, args.rpm)  # type: ignore
-
-    @classmethod
-    def from_data_points(
-        cls,
-        data_points: Sequence[tuple[N, N]],
         *,
-        multiplier: N = 1,
-        rpm: Optional[N] = None,
-    ) -> Self:
-        damages, ranges = zip(*data_points)
-        return cls(damages, ranges, multiplier, rpm)
-
-    @staticmethod
-    def _calculate_ttk(shots: N, rpm: Optional[N] = None) -> Optional[float]:
-        if not rpm:
-            return None
-
-        ttk = 60 * (shots - 1) / rpm
-        ttk = round(ttk, 5)
-        return ttk or None
-
-    def _create_output_data(self, data_points: Sequence[tuple[int, N]]) -> list[PfgPoint]:
-        return [
-            PfgPoint(
-                shots=shots,
-                range=remove_decimal(range_),
-                ttk=self._calculate_ttk(shots=shots, rpm=self.rpm),
-            )
-            for shots, range_ in data_points
-        ]
-
-    def evaluate_damage_to_shots(self, value: N) -> Optional[N]:
-        """Evaluates the damage value to determine the corresponding number of shots needed.
-
-        Args:
-            value (N): The damage value to evaluate.
-
-        Returns:
-            Optional[N]: The number of shots needed to inflict the given damage value.
-                         Returns None if the damage value is less than the minimum damage.
-        """
-
-        # First value
-        prev_damage = self.shots_to_damage[1]
-        if value >= prev_damage:
-            return 1
-
-        # Find which segment x belongs to
-        for i, damage in self.shots_to_damage.items():
-            if prev_damage > value >= damage:
-                return i
-            prev_damage = damage
-
-    def evaluate_shots_to_kill(self, d: N) -> list[tuple[G, N]]:
-        matches = []
-        g: G = 0
-
-        # Iterate over the data points
-        # We skip the last data point to avoid an IndexError
-        for i, data_point in enumerate(self.data_points[:-1]):
-            d0, r0 = data_point
-            d1, r1 = self.data_points[i + 1]
-
-            # Check if y is within the y-range of the current segment
-            if min(d0, d1) <= d <= max(d0, d1):
-
-                # If the graph is decreasing
-                if d0 > d1 and d != d1:
-                    g = 1
-                # If the graph is increasing
-                elif d0 < d1:
-                    g = 0
-
-                # Avoid dividing by zero
-                if d0 != d1:
-                    match = r0 + (d - d0) * (r1 - r0) / (d1 - d0)
-                    matches.append((g, match))
-
-                # If y1 and y2 are equal and x1 is not already in the list,
-                # add x1 to the list
-                elif len(matches) == 0 or r0 != matches[-1]:
-                    matches.append((g, r0))
-
-        return matches
-
-    def calculate_progression(self) -> list[PfgPoint]:
-        progression = []
-
-        # Weapon start
-        first_shots_to_kill = self.evaluate_damage_to_shots(self.damages[0])
-        if first_shots_to_kill is not None:
-            progression.append((first_shots_to_kill, 0))
-
-        # Weapon progression
-        for i, damage in self.shots_to_damage.items():
-            points = self.evaluate_shots_to_kill(damage)
-
-            for g, studs in points:
-                point = i + g, round(studs, 2)
-                if progression[-1][0] != point[0]:
-                    progression.append(point)
-
-        # Sort the list by the ranges
-        progression.sort(key=lambda x: x[1])
-
-        # This is a hack but,
-        # we need to filter out consecutive duplicates where
-        # the first value of a point matches the last one in the list
-        progression = [
-            point
-            for i, point in enumerate(progression)
-            if i == 0 or progression[i - 1][0] != point[0]
-        ]
-
-        # Final step - create the output
-        progression = self._create_output_data(progression)
-
-        return progression
-
-    def __repr__(self) -> str:
-        return (
-            f'{self.__class__.__name__}('
-            f'damages={self.damages}, '
-            f'ranges={self.ranges}, '
-            f'multiplier={self.multiplier}, '
-            f'rpm={self.rpm})'
-        )
-
-    def __eq__(self, other: object) -> bool:
-        if not isinstance(other, PfgCalculator):
-            return NotImplemented
-        return (
-            self.damages == other.damages
-            and self.ranges == other.ranges
-            and self.multiplier == other.multiplier
-            and self.rpm == other.rpm
-        )
-
-
-class PfgEmbed(discord.Embed):
-    def __init__(
-        self, data_points: Sequence[PfgPoint], multiplier: N, rpm: Optional[N] = None
+        fields: Optional[Sequence[tuple[str, str]]] = None,
     ):
         super().__init__(title='PF Gun STK Calculator - Multipoint')
         self.data_points: Sequence[PfgPoint] = data_points
         self.multiplier: N = remove_decimal(multiplier)
         self.rpm: Optional[N] = remove_decimal(rpm) if rpm is not None else None
-        self._create_field_items()
 
-    def _create_field_items(self) -> None:
-        data_points = self.data_points
+        # Fields can be passed in if they were rendered before
+        if fields is None:
+            fields = self.render_fields(data_points)
+
+        for name, value in fields:
+            self.add_field(name=name, value=value, inline=True)
+
+        self.set_footer(text=f"Multiplier: {self.multiplier}\tRPM: {self.rpm}")
+
+    @staticmethod
+    def render_fields(data_points: Sequence[PfgPoint]) -> list[tuple[str, str]]:
+        """Renders the ``(name, value)`` pair of every embed field."""
+        fields = []
 
         # Iterate over the data points
         len_data_points = len(data_points)
@@ -303,20 +117,81 @@ class PfgEmbed(discord.Embed):
                 field_items.append(f'{data_point.ttk}s to kill')
 
             # Add field and join field items
-            self.add_field(
-                name=f'{data_point.shots} shot{field_name_extra}',
-                value='\n'.join(field_items),
-                inline=True,
-            )
+            fields.append((f'{data_point.shots} shot{field_name_extra}', '\n'.join(field_items)))
 
-        self.set_footer(text=f"Multiplier: {self.multiplier}\tRPM: {self.rpm}")
+        return fields
+
+
+class PfgResult(NamedTuple):
+    data_points: list[PfgPoint]
+    fields: list[tuple[str, str]]
 
 
 class PfgunRewrite(commands.Cog):
     def __init__(self, client: MoistBot):
         self.client: MoistBot = client
 
-    async def _save_params_to_db(
+        # Popular guns make up most of the traffic, so keep their results around
+        self.progression_cache: LRUCache[PfgParams, PfgResult] = LRUCache(maxsize=512, ttl=60 * 60)
+        self.client.caches['pfg_progression'] = self.progression_cache
+
+        self.param_writes: WriteBehindBuffer[int, PfgParams] = WriteBehindBuffer(
+            self._save_params_to_db, interval=2.0, max_pending=64
+        )
+        self.client.write_buffers['pfg_param_cache'] = self.param_writes
+
+        # Follow-up subcommands are the common case, keep decoded params in memory
+        self.param_cache: LRUCache[int, PfgParams] = LRUCache(maxsize=4096)
+        self.client.caches['pfg_params'] = self.param_cache
+
+        # Damages and ranges are stored as float64 blobs from schema version 2
+        self.param_blobs: bool = self.client.schema_versions.get('pfg_param_cache', 1) >= 2
+
+        # Gun name autocomplete, the trie is built once the gun index is loaded
+        self.gun_index: Optional[GunIndex] = None
+        self.gun_trie: PrefixTrie = PrefixTrie(())
+        self.gun_choices_cache: LRUCache[str, list[app_commands.Choice[str]]] = LRUCache(maxsize=1024)
+        self.client.caches['pfg_gun_choices'] = self.gun_choices_cache
+        self._latest_autocomplete: dict[int, int] = {}
+
+    async def cog_load(self) -> None:
+        self.param_writes.start()
+
+        try:
+            index = await asyncio.to_thread(get_index)
+        except FileNotFoundError:
+            logger.warning('Gun stats sheet not found, gun autocomplete is unavailable.')
+        else:
+            # Only suggest guns the command accepts
+            guns = {key: params for key, params in index.guns.items() if not is_shotgun(params)}
+            self.gun_index = GunIndex(guns)
+            self.gun_trie = PrefixTrie(guns, limit=AUTOCOMPLETE_LIMIT)
+
+    async def cog_unload(self) -> None:
+        self.client.caches.pop('pfg_progression', None)
+        self.client.caches.pop('pfg_params', None)
+        self.client.caches.pop('pfg_gun_choices', None)
+        self.client.write_buffers.pop('pfg_param_cache', None)
+        await self.param_writes.close()
+
+    def _create_embed(
+        self,
+        damages: Sequence[N],
+        ranges: Sequence[N],
+        multiplier: N = 1,
+        rpm: Optional[N] = None,
+    ) -> PfgEmbed:
+        key = PfgParams(damages, ranges, multiplier, rpm).canonicalize()
+
+        result = self.progression_cache.get(key)
+        if result is None:
+            data_points = PfgCalculator(*key).calculate_progression()
+            result = PfgResult(data_points, PfgEmbed.render_fields(data_points))
+            self.progression_cache.set(key, result)
+
+        return PfgEmbed(result.data_points, multiplier, rpm, fields=result.fields)
+
+    def _save_params(
         self,
         user_id: int,
         damages: Sequence[N],
@@ -324,15 +199,35 @@ class PfgunRewrite(commands.Cog):
         multiplier: N = 1,
         rpm: Optional[N] = None,
     ) -> None:
+        params = PfgParams(damages, ranges, multiplier, rpm)
+        self.param_cache.set(user_id, params)
+        self.param_writes.put(user_id, params)
+
+    def _encode_floats(self, values: Sequence[N]) -> bytes:
+        if self.param_blobs:
+            return pack_floats(values)
+        return orjson.dumps(values)
+
+    def _decode_floats(self, data: Union[bytes, str]) -> list[N]:
+        if self.param_blobs:
+            return unpack_floats(data)  # type: ignore
+        return orjson.loads(data)
+
+    async def _save_params_to_db(self, entries: list[tuple[int, PfgParams]]) -> None:
+        encode = self._encode_floats
+        rows = [
+            (user_id, encode(params.damages), encode(params.ranges), params.multiplier, params.rpm)
+            for user_id, params in entries
+        ]
+
         async with self.client.pool.acquire() as conn:
-            async with conn:
+            async with conn.transaction():
                 query = """--sql
                     INSERT OR REPLACE INTO pfg_param_cache (user_id, damages, ranges, multiplier, rpm)
                     VALUES (?, ?, ?, ?, ?)
                 """
-                await conn.execute(
-                    query, user_id, orjson.dumps(damages), orjson.dumps(ranges), multiplier, rpm
-                )
+                async with conn.cursor() as cursor:
+                    await cursor.executemany(query, rows)
 
     async def _get_params_from_db(self, user_id: int) -> Optional[sqlite3.Row]:
         async with self.client.pool.acquire() as conn:
@@ -344,21 +239,38 @@ class PfgunRewrite(commands.Cog):
                 """
                 return await conn.fetchone(query, user_id)
 
+    async def _get_params(self, user_id: int) -> Optional[PfgParams]:
+        params = self.param_cache.get(user_id)
+        if params is not None:
+            return params
+
+        params = self.param_writes.get(user_id)
+        if params is None:
+            row = await self._get_params_from_db(user_id)
+
+            # A save might have happened while waiting on the database
+            if user_id in self.param_cache:
+                return self.param_cache.get(user_id)
+
+            if not row:
+                return None
+
+            decode = self._decode_floats
+            params = PfgParams(decode(row['damages']), decode(row['ranges']), row['multiplier'], row['rpm'])
+
+        self.param_cache.set(user_id, params)
+        return params
+
     @commands.cooldown(rate=1, per=2, type=commands.BucketType.user)
     @commands.hybrid_group(invoke_without_command=True, fallback='calculate')
     async def pfg(self, ctx: Context, *, args: PfgFlags):
         """PF Gun STK Calculator - Multipoint."""
 
-        pfg_calc = PfgCalculator.from_pfg_args(args)
-        data_points = pfg_calc.calculate_progression()
-
-        embed = PfgEmbed(data_points, args.multiplier, args.rpm)
+        embed = self._create_embed(args.damages, args.ranges, args.multiplier, args.rpm)
         await ctx.reply(embed=embed)
 
         # Save params to db
-        await self._save_params_to_db(
-            ctx.author.id, args.damages, args.ranges, args.multiplier, args.rpm
-        )
+        self._save_params(ctx.author.id, args.damages, args.ranges, args.multiplier, args.rpm)
 
     # @pfg.command()
     # @app_commands.describe(
@@ -395,26 +307,23 @@ class PfgunRewrite(commands.Cog):
         """Change the multiplier paramater of your previous command."""
 
         # Get parameters
-        row = await self._get_params_from_db(ctx.author.id)
+        params = await self._get_params(ctx.author.id)
 
-        if not row:
+        if not params:
             await ctx.reply(embed=NO_PREV_DATA_EMBED)
             return
 
         # Setup parameters
-        damages = orjson.loads(row['damages'])
-        ranges = orjson.loads(row['ranges'])
+        damages = params.damages
+        ranges = params.ranges
         multiplier = multiplier  # Just explicitly showing this
-        rpm = row['rpm']
-
-        pfg_calc = PfgCalculator(damages, ranges, multiplier, rpm)
-        data_points = pfg_calc.calculate_progression()
+        rpm = params.rpm
 
-        embed = PfgEmbed(data_points, multiplier, rpm)
+        embed = self._create_embed(damages, ranges, multiplier, rpm)
         await ctx.reply(embed=embed)
 
         # Save params to db
-        await self._save_params_to_db(ctx.author.id, damages, ranges, multiplier, rpm)
+        self._save_params(ctx.author.id, damages, ranges, multiplier, rpm)
 
     @commands.cooldown(rate=1, per=2, type=commands.BucketType.user)
     @app_commands.describe(rpm='The RPM to use.')
@@ -423,26 +332,78 @@ class PfgunRewrite(commands.Cog):
         """Change the RPM paramater of your previous command."""
 
         # Get parameters
-        row = await self._get_params_from_db(ctx.author.id)
+        params = await self._get_params(ctx.author.id)
 
-        if not row:
+        if not params:
             await ctx.reply(embed=NO_PREV_DATA_EMBED)
             return
 
         # Setup parameters
-        damages = orjson.loads(row['damages'])
-        ranges = orjson.loads(row['ranges'])
-        multiplier = row['multiplier']
+        damages = params.damages
+        ranges = params.ranges
+        multiplier = params.multiplier
         rpm = rpm  # Just explicitly showing this
 
-        pfg_calc = PfgCalculator(damages, ranges, multiplier, rpm)
-        data_points = pfg_calc.calculate_progression()
+        embed = self._create_embed(damages, ranges, multiplier, rpm)
+        await ctx.reply(embed=embed)
+
+        # Save params to db
+        self._save_params(ctx.author.id, damages, ranges, multiplier, rpm)
+
+    @commands.cooldown(rate=1, per=2, type=commands.BucketType.user)
+    @app_commands.describe(name='The gun to load the stats of.')
+    @pfg.command(name='gun')
+    async def gun(self, ctx: Context, *, name: str):
+        """Calculate using the stats of a gun from the PF stats sheet."""
 
-        embed = PfgEmbed(data_points, multiplier, rpm)
+        # Get parameters
+        name, params = await get_gun_params(name)
+
+        if is_shotgun(params):
+            raise commands.BadArgument('Shotguns are not supported here, use `pfgun gun` instead.')
+
+        # Setup parameters
+        damages = [float(params['close_damage']), float(params['long_damage'])]
+        ranges = [params['close_range'], params['long_range']]
+        multiplier = params['multiplier']
+        rpm = params['rpm']
+
+        # Show which gun the stats were loaded from
+        embed = self._create_embed(damages, ranges, multiplier, rpm)
+        embed.set_footer(text=f"Gun: {name}\tMultiplier: {multiplier}\tRPM: {rpm}")
         await ctx.reply(embed=embed)
 
         # Save params to db
-        await self._save_params_to_db(ctx.author.id, damages, ranges, multiplier, rpm)
+        self._save_params(ctx.author.id, damages, ranges, multiplier, rpm)
+
+    @gun.autocomplete('name')
+    async def gun_autocomplete(
+        self, interaction: discord.Interaction, current: str
+    ) -> list[app_commands.Choice[str]]:
+        prefix = normalize_gun(current)
+        choices = self.gun_choices_cache.get(prefix)
+        if choices is not None:
+            return choices
+
+        user_id = interaction.user.id
+
+        # Only answer the latest keystroke of each user,
+        # Discord discards the responses of the older ones anyway
+        self._latest_autocomplete[user_id] = interaction.id
+        await asyncio.sleep(AUTOCOMPLETE_DEBOUNCE)
+        if self._latest_autocomplete.get(user_id) != interaction.id:
+            return []
+        del self._latest_autocomplete[user_id]
+
+        names = self.gun_trie.complete(prefix)
+
+        # Fall back to fuzzy matching for typos
+        if not names and prefix and self.gun_index is not None:
+            names = self.gun_index.search(prefix, limit=AUTOCOMPLETE_LIMIT)
+
+        choices = [app_commands.Choice(name=name, value=name) for name in names]
+        self.gun_choices_cache.set(prefix, choices)
+        return choices
 
 
 async def setup(client: MoistBot) -> None:
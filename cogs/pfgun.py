@@ -3,6 +3,8 @@ from __future__ import annotations
 import discord
 from discord.ext import commands
 
+import asyncio
+import logging
 from math import log10
 from itertools import chain
 from typing_extensions import Self
@@ -10,13 +12,16 @@ from typing import TYPE_CHECKING, Union, Optional
 
 # Additional
 from cogs.pfgun_utils.dicts import *
-from cogs.pfgun_utils.CacheManager import cache_arg, get_params
+from cogs.pfgun_utils.CacheManager import ParamCache
+from cogs.pfgun_utils.SheetReader import get_gun_params, get_index
 
 if TYPE_CHECKING:
     from main import MoistBot
     from cogs.utils.context import Context
 
 
+logger = logging.getLogger('discord.' + __name__)
+
 """
 THIS CODE IS ABSOLUTE SLOP THAT I WROTE A LONG TIME AGO.
 I WILL REWRITE THIS EVENTUALLY.
@@ -169,9 +174,25 @@ class PfGunEmbed(discord.Embed):
 
 
 class Pfgun(commands.Cog):
+    cache: ParamCache
+
     def __init__(self, client: MoistBot):
         self.client: MoistBot = client
 
+    async def cog_load(self) -> None:
+        self.cache = await ParamCache.open()
+        self.client.write_buffers['pfgun_params'] = self.cache.writes
+
+        # Build or load the gun index up front so lookups don't hit the disk
+        try:
+            await asyncio.to_thread(get_index)
+        except FileNotFoundError:
+            logger.warning('Gun stats sheet not found, the pfgun gun command is unavailable.')
+
+    async def cog_unload(self) -> None:
+        self.client.write_buffers.pop('pfgun_params', None)
+        await self.cache.close()
+
     @commands.group(invoke_without_command=True)
     async def pfgun(
             self,
@@ -196,7 +217,7 @@ class Pfgun(commands.Cog):
 
         ''' Save to cache '''
         if ctx.invoked_with == 'pfgun':  # Check if the command wasn't invoked by a subcommand
-            cache_arg(ctx.args[1:])  # Args without command object
+            self.cache.cache_arg(ctx.args[1:])  # Args without command object
 
     @pfgun.command()
     async def hp(self, ctx: Context, *, user: Optional[discord.User] = commands.Author):
@@ -204,7 +225,7 @@ class Pfgun(commands.Cog):
 
         ''' Load from cache '''
         user = str(user.id)
-        params = await get_params(user)
+        params = await self.cache.get_params(user)
 
         # Update embed
         embed = PfGunEmbed(
@@ -230,7 +251,7 @@ class Pfgun(commands.Cog):
 
         ''' Load from cache '''
         user = str(user.id)
-        params = await get_params(user)
+        params = await self.cache.get_params(user)
 
         # Apply modifiers
         params['close_range'] *= 0.5
@@ -252,7 +273,7 @@ class Pfgun(commands.Cog):
 
         ''' Load from cache '''
         user = str(user.id)
-        params = await get_params(user)
+        params = await self.cache.get_params(user)
 
         # Update embed
         embed = PfGunEmbed(
@@ -265,28 +286,28 @@ class Pfgun(commands.Cog):
 
         await ctx.reply(embed=embed)
 
-    # @pfgun.command(clean_params=True)
-    # async def gun(self, ctx, *, gun):
-    #     """
-    #     Loads values from *PF Advance Statistics* sheet and invokes main command
-    #     Values from this command are cached
-    #     """
-    #     params = await get_gun_params(gun)
-    #
-    #     # Update embed
-    #     embed = PfGunEmbed(ctx)\
-    #         .gen_embed(**params)\
-    #         .set_footer(text=f"Multiplier: {params['multiplier']}\tRPM: {params['rpm']}")
-    #
-    #     await ctx.reply(embed=embed)
-    #
-    #     # Cache
-    #     cache_arg(list(chain.from_iterable([[ctx], params.values()])))
+    @pfgun.command(clean_params=True)
+    async def gun(self, ctx: Context, *, gun: str):
+        """
+        Loads values from *PF Advance Statistics* sheet and invokes main command
+        Values from this command are cached
+        """
+        name, params = await get_gun_params(gun)
+
+        # Update embed
+        embed = PfGunEmbed(ctx)\
+            .gen_embed(**params)\
+            .set_footer(text=f"Gun: {name}\tMultiplier: {params['multiplier']}\tRPM: {params['rpm']}")
+
+        await ctx.reply(embed=embed)
+
+        # Cache
+        self.cache.cache_arg(list(chain.from_iterable([[ctx], params.values()])))
 
     @pfgun.command()
     async def rpm(self, ctx: Context, rpm: Union[int, float]):
         """Changes *rpm* parameter and invokes main command"""
-        params = await get_params(str(ctx.author.id))
+        params = await self.cache.get_params(str(ctx.author.id))
 
         # Apply modifiers
         params['rpm'] = rpm
@@ -303,12 +324,12 @@ class Pfgun(commands.Cog):
         await ctx.reply(embed=embed)
 
         # Cache
-        cache_arg(list(chain.from_iterable([[ctx], params.values()])))
+        self.cache.cache_arg(list(chain.from_iterable([[ctx], params.values()])))
 
     @pfgun.command(aliases=['m', 'multiplier'])
     async def multi(self, ctx: Context, multiplier: float):
         """Changes *multiplier* parameter and invokes main command"""
-        params = await get_params(str(ctx.author.id))
+        params = await self.cache.get_params(str(ctx.author.id))
 
         # Apply modifiers
         params['multiplier'] = multiplier
@@ -325,7 +346,7 @@ class Pfgun(commands.Cog):
         await ctx.reply(embed=embed)
 
         # Cache
-        cache_arg(list(chain.from_iterable([[ctx], params.values()])))
+        self.cache.cache_arg(list(chain.from_iterable([[ctx], params.values()])))
 
     @pfgun.command(hidden=True)
     @commands.is_owner()
@@ -1,51 +1,71 @@
+from __future__ import annotations
+
+import os
 import json
-from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+from typing import Optional
 
+from cogs.utils.database import AsyncJsonDB
+from cogs.utils.write_buffer import WriteBehindBuffer
 
-# ThreadPoolExecutor with 1 worker so tasks run in sequence
-executor = ThreadPoolExecutor(max_workers=1)
+logger = logging.getLogger('discord.' + __name__)
 
+CACHE_PATH = 'pfgun_params.json'
+LEGACY_CACHE_PATH = 'pfgun_cache.json'
 
-def cache_arg(args: list):
-    """ Adds caching operations to queue """
-    executor.submit(_save_cache, *args)
 
+class ParamCache:
+    """Keyed store of the last ``pfgun`` parameters of every user."""
 
-def _save_cache(ctx, d1, d2, r1, r2, multiplier, rpm):
-    """ Save to cache """
+    def __init__(self, db: AsyncJsonDB):
+        self.db: AsyncJsonDB = db
+        self.writes: WriteBehindBuffer[str, dict] = WriteBehindBuffer(self.db.set_many, interval=2.0, max_pending=64)
 
-    with open("pfgun_cache.json", "r") as f:
-        data = json.load(f)
+    @classmethod
+    async def open(cls, filepath: str = CACHE_PATH, legacy_filepath: str = LEGACY_CACHE_PATH) -> ParamCache:
+        self = cls(await AsyncJsonDB.open(filepath))
+        if os.path.exists(legacy_filepath):
+            await self._migrate_legacy(legacy_filepath)
 
-        user = str(ctx.author.id)
-        users = {}
-        args = {"close_damage": d1, "long_damage": d2, "close_range": r1, "long_range": r2, "multiplier": multiplier, "rpm": rpm}
+        self.writes.start()
+        return self
 
-        # Get rid of old arguments if user already in cache
-        for num, u in enumerate(data["users"]):
-            if user in u:
-                del data["users"][num]
-                break
+    async def _migrate_legacy(self, legacy_filepath: str) -> None:
+        """Imports the old list based ``pfgun_cache.json`` and moves it out of the way."""
+        def load() -> dict:
+            with open(legacy_filepath, 'r') as f:
+                return json.load(f)
 
-        # Add arguments as dict
-        users[user] = args
-        data["users"].append(users)
+        data = await asyncio.to_thread(load)
+        await self.db.set_many(
+            (user, args)
+            for u in data.get('users', [])
+            for user, args in u.items()
+        )
 
-    # Save to file
-    with open("pfgun_cache.json", "w") as f:
-        json.dump(data, f, indent=4)
+        await self.db.compact()
+        os.replace(legacy_filepath, legacy_filepath + '.migrated')
+        logger.info(f'Migrated {len(await self.db.keys())} users from {legacy_filepath}')
 
+    def cache_arg(self, args: list) -> None:
+        """ Save to cache, written to disk in the background """
+        ctx, d1, d2, r1, r2, multiplier, rpm = args
 
-async def get_params(user) -> dict:
-    """ Returns parameters of specified user from cache """
+        user = str(ctx.author.id)
+        args = {"close_damage": d1, "long_damage": d2, "close_range": r1, "long_range": r2, "multiplier": multiplier, "rpm": rpm}
+        self.writes.put(user, args)
 
-    with open("pfgun_cache.json", "r") as f:
-        data = json.load(f)
+    async def get_params(self, user: str) -> Optional[dict]:
+        """ Returns parameters of specified user from cache """
 
-        for u in data["users"]:
-            if user in u:
-                return u[user]
+        params = self.writes.get(user)
+        if params is None:
+            params = await self.db.get(user)
 
+        # Copy since callers modify the parameters
+        return dict(params) if params is not None else None
 
-if __name__ == '__main__':
-    pass    # TODO: Manual caching later uwu?
+    async def close(self) -> None:
+        await self.writes.close()
+        await self.db.close()
@@ -1,34 +1,191 @@
+from __future__ import annotations
+
+import os
 import json
+import logging
+from bisect import bisect_left
+from collections import Counter
+from typing import Optional
+
+import orjson
 from discord.ext import commands
 
-with open(r"./functions/SheetToJson/output_advinfosheet.json", "r") as f:
-    data = json.load(f)
+logger = logging.getLogger('discord.' + __name__)
+
+SHEET_PATH = r"./functions/SheetToJson/output_advinfosheet.json"
+INDEX_PATH = r"./functions/SheetToJson/gun_index.json"
+INDEX_VERSION = 1
+
+
+def normalize_gun(gun: str) -> str:
+    return gun.replace("-", "").replace(" ", "").upper()
+
+
+def _trigrams(key: str) -> set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def parse_gun(values: dict) -> dict:
+    """Parses the raw sheet values of a gun into ``pfgun`` parameters.
+
+    Raises:
+        KeyError, ValueError: If the values are missing or malformed.
+    """
+    params = {}
+    params["close_damage"], params["long_damage"] = \
+        values["BASE DAMAGE"].split(" - ")
+
+    params["close_range"], params["long_range"] = list(
+        map(int, values["DAMAGE RANGE"].split(" - "))
+    )
 
+    params["multiplier"] = float(
+        values["MULTIPLIERS"].split(" / ")[1].strip("x")
+    )
 
-async def get_gun_params(gun: str):
+    params["rpm"] = [
+        int(val)
+        for val in values["FIRE RATE"].replace(".", "").replace(",", "").split(" ")
+        if val.isdigit()
+    ][0]
+
+    return params
+
+
+def build_index(sheet_path: str = SHEET_PATH, index_path: str = INDEX_PATH) -> dict[str, dict]:
+    """Parses the whole sheet once and saves the typed parameters of every gun."""
+    with open(sheet_path, "r") as f:
+        data = json.load(f)
+
+    guns = {}
+    for key, values in data["data"].items():
+        try:
+            guns[normalize_gun(key)] = parse_gun(values)
+        except (KeyError, ValueError, IndexError):
+            logger.debug(f"Skipping gun with unsupported stats: {key}")
+
+    with open(index_path, "wb") as f:
+        f.write(orjson.dumps({"version": INDEX_VERSION, "guns": guns}))
+
+    logger.info(f"Built gun index with {len(guns)}/{len(data['data'])} guns")
+    return guns
+
+
+def _read_index(index_path: str) -> Optional[dict[str, dict]]:
     try:
-        key = gun.replace("-", "").replace(" ", "").upper()
-        values = data["data"][key]
+        with open(index_path, "rb") as f:
+            index = orjson.loads(f.read())
+    except FileNotFoundError:
+        return None
+
+    return index["guns"] if index.get("version") == INDEX_VERSION else None
 
-        params = {}
-        params["close_damage"], params["long_damage"] =\
-            values["BASE DAMAGE"].split(" - ")
 
-        params["close_range"], params["long_range"] = list(
-            map(int, values["DAMAGE RANGE"].split(" - "))
+class GunIndex:
+    """Gun parameters with prefix and trigram indexes for fuzzy lookups."""
+
+    def __init__(self, guns: dict[str, dict]):
+        self.guns: dict[str, dict] = guns
+        self.sorted_keys: list[str] = sorted(guns)
+
+        self.trigrams: dict[str, list[str]] = {}
+        for key in self.sorted_keys:
+            for trigram in _trigrams(key):
+                self.trigrams.setdefault(trigram, []).append(key)
+
+    @classmethod
+    def load(cls, sheet_path: str = SHEET_PATH, index_path: str = INDEX_PATH) -> GunIndex:
+        """Loads the prebuilt index, rebuilding it if it's missing or older than the sheet."""
+        stale = os.path.exists(sheet_path) and (
+            not os.path.exists(index_path)
+            or os.path.getmtime(index_path) < os.path.getmtime(sheet_path)
         )
 
-        params["multiplier"] = float(
-            values["MULTIPLIERS"].split(" / ")[1].strip("x")
+        guns = None if stale else _read_index(index_path)
+        if guns is None:
+            guns = build_index(sheet_path, index_path)
+        return cls(guns)
+
+    def get(self, gun: str) -> Optional[dict]:
+        params = self.guns.get(normalize_gun(gun))
+        return dict(params) if params is not None else None
+
+    def search(self, query: str, limit: int = 25) -> list[str]:
+        """Returns the gun keys best matching the query, prefix matches first."""
+        query = normalize_gun(query)
+        if not query:
+            return self.sorted_keys[:limit]
+
+        # Prefix matches
+        results = []
+        i = bisect_left(self.sorted_keys, query)
+        while i < len(self.sorted_keys) and len(results) < limit:
+            key = self.sorted_keys[i]
+            if not key.startswith(query):
+                break
+            results.append(key)
+            i += 1
+
+        if len(results) >= limit:
+            return results
+
+        # Fill up with the keys sharing the most trigrams
+        query_trigrams = _trigrams(query)
+        scores = Counter(
+            key
+            for trigram in query_trigrams
+            for key in self.trigrams.get(trigram, ())
         )
 
-        params["rpm"] = [
-            int(val)
-            for val in values["FIRE RATE"].replace(".", "").replace(",", "").split(" ")
-            if val.isdigit()
-        ][0]
+        seen = set(results)
+        for key, shared in scores.most_common():
+            if len(results) >= limit:
+                break
+            # Require at least a third of the trigrams to match
+            if shared * 3 < len(query_trigrams):
+                break
+            if key not in seen:
+                results.append(key)
 
-    except (KeyError, ValueError):
-        raise commands.BadArgument()
+        return results
 
-    return params
+
+_index: Optional[GunIndex] = None
+
+
+def get_index() -> GunIndex:
+    global _index
+    if _index is None:
+        _index = GunIndex.load()
+    return _index
+
+
+async def get_gun_params(gun: str) -> tuple[str, dict]:
+    """Looks up the parameters of a gun by its exact name.
+
+    Returns:
+        The normalized name of the gun and its parameters.
+
+    Raises:
+        commands.BadArgument: If the gun isn't in the sheet, with the closest matches.
+    """
+    try:
+        index = get_index()
+    except FileNotFoundError:
+        raise commands.BadArgument(":warning: Gun stats are not available.")
+
+    key = normalize_gun(gun)
+    params = index.get(key)
+    if params is None:
+        matches = index.search(key, limit=5)
+        if matches:
+            suggestions = ", ".join(f"`{match}`" for match in matches)
+            raise commands.BadArgument(f":warning: Gun `{gun}` not found. Did you mean: {suggestions}?")
+        raise commands.BadArgument(f":warning: Gun `{gun}` not found.")
+
+    return key, params
+
+
+if __name__ == '__main__':
+    build_index()
@@ -4,10 +4,14 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 
+import importlib
 from io import BytesIO
 from PIL import Image, ImageDraw, ImageFilter
 from typing import TYPE_CHECKING, Optional, Union
-from concurrent.futures import ProcessPoolExecutor
+from cogs.utils.cache import LRUCache
+from cogs.utils.encoder import encode_image
+from cogs.utils.image_cache import render_cached
+from cogs.utils.image_jobs import sample_image
 
 if TYPE_CHECKING:
     from main import MoistBot
@@ -16,12 +20,43 @@ if TYPE_CHECKING:
 
 FLAG_UA = Image.open('./assets/Ukraine flag.png').convert('RGBA')
 
+# Size avatars are rendered at, unless configured otherwise
+RENDER_SIZE = 2048
+
+
+def render_size() -> int:
+    """``UKRAINE_RENDER_SIZE`` in the config, read by the command and the workers alike."""
+    return getattr(importlib.import_module('config'), 'UKRAINE_RENDER_SIZE', RENDER_SIZE)
+
+# (kind, avatar size, ring, upscale, descale)
+MaskKey = tuple[str, tuple[int, int], Union[int, float], int, Union[int, float]]
+
+
+def _image_bytes(img: Image.Image) -> int:
+    return img.width * img.height * len(img.getbands())
+
+
+# Per-process caches by output size, bounded in bytes
+_masks: LRUCache[MaskKey, Image.Image] = LRUCache(32 * 1024 * 1024, weigher=_image_bytes)
+_flags: LRUCache[tuple[int, int], Image.Image] = LRUCache(48 * 1024 * 1024, weigher=_image_bytes)
+
+
+def get_flag(size: tuple[int, int]) -> Image.Image:
+    """Returns the flag resized to the size, resizing it only once per process. Don't modify it."""
+    if size == FLAG_UA.size:
+        return FLAG_UA
+
+    flag = _flags.get(size)
+    if flag is None:
+        flag = FLAG_UA.resize(size, Image.BICUBIC)
+        _flags.set(size, flag)
+    return flag
+
 
 # TODO: some major cleanup is needed in this class
 class ImageGen:
     def __init__(self, avatar: Image.Image, ring: Union[int, float] = 7, upscale: int = 4):
         self.avatar: Image.Image = avatar
-        self.flag_ua: Image.Image = FLAG_UA.copy()
         self.RING: Union[int, float] = ring
         self.UPSCALE: int = upscale
 
@@ -41,9 +76,8 @@ class ImageGen:
         # Upscale rounded
         self.ru_width, self.ru_height = (self.r_width * self.UPSCALE), (self.r_height * self.UPSCALE)
 
-        # Resize if needed
-        if self.flag_ua.size != self.avatar.size:
-            self.flag_ua = self.flag_ua.resize(self.avatar.size, Image.BICUBIC)
+        # The avatar is pasted onto it
+        self.flag_ua: Image.Image = get_flag(self.avatar.size).copy()
 
     @staticmethod
     def _gen_mask(
@@ -65,33 +99,45 @@ class ImageGen:
         mask = mask.filter(ImageFilter.SMOOTH)  # Smooth edges
         return mask
 
+    def _mask(self, kind: str, descale: Union[int, float] = 0) -> Image.Image:
+        """The mask of a ring generator, only generated once per size, ring and descale."""
+        key = (kind, self.avatar.size, self.RING, self.UPSCALE, descale)
+        mask = _masks.get(key)
+        if mask is not None:
+            return mask
+
+        if kind == 'proportional':
+            mask = self._gen_mask(
+                start_size=(self.ru_width, self.ru_height),
+                x1y1=(0, 0),
+                x2y2=(self.ru_width, self.ru_width),
+                final_size=(self.r_width, self.r_height),
+                descale=descale,
+            )
+        else:
+            mask = self._gen_mask(
+                start_size=(self.u_width, self.u_height),
+                x1y1=(self.u_ring_w, self.u_ring_h),
+                x2y2=(self.u_height - self.u_ring_w, self.u_height - self.u_ring_h),
+                final_size=self.avatar.size,
+                descale=descale,
+            )
+
+        _masks.set(key, mask)
+        return mask
+
     def proportional(self) -> Image.Image:
         """Proportional ring generator"""
 
         masked_avatar = Image.new('RGBA', (self.r_width, self.r_height), color=(255, 255, 255, 0))
         avatar = self.avatar.resize((self.r_width, self.r_height), Image.LANCZOS)
 
-        masked_avatar = Image.composite(
-            avatar,
-            masked_avatar,
-            mask=self._gen_mask(
-                start_size=(self.ru_width, self.ru_height),
-                x1y1=(0, 0),
-                x2y2=(self.ru_width, self.ru_width),
-                final_size=(self.r_width, self.r_height),
-            ),
-        )
+        masked_avatar = Image.composite(avatar, masked_avatar, mask=self._mask('proportional'))
 
         self.flag_ua.paste(
             masked_avatar,
             box=(round(self.ring_w / 2), round(self.ring_h / 2)),
-            mask=self._gen_mask(
-                start_size=(self.ru_width, self.ru_height),
-                x1y1=(0, 0),
-                x2y2=(self.ru_width, self.ru_width),
-                final_size=(self.r_width, self.r_height),
-                descale=4,
-            ),
+            mask=self._mask('proportional', descale=4),
         )
 
         return self.flag_ua
@@ -99,36 +145,24 @@ class ImageGen:
     def subtractive(self) -> Image.Image:
         """Subtractive ring generator"""
 
-        img = Image.composite(
-            self.avatar,
-            self.flag_ua,
-            mask=self._gen_mask(
-                start_size=(self.u_width, self.u_height),
-                x1y1=(self.u_ring_w, self.u_ring_h),
-                x2y2=(self.u_height - self.u_ring_w, self.u_height - self.u_ring_h),
-                final_size=self.avatar.size,
-            ),
-        )
+        img = Image.composite(self.avatar, self.flag_ua, mask=self._mask('subtractive'))
         return img
 
 
 class Ukraine(commands.Cog):
     def __init__(self, client: MoistBot):
         self.client: MoistBot = client
-        self.executor = ProcessPoolExecutor()
-        self.execute = self.client.loop.run_in_executor
 
     @staticmethod
-    def _get_buffer(avatar: bytes) -> BytesIO:
-        buffer = BytesIO(avatar)
-        avatar = Image.open(buffer)
-        img = ImageGen(avatar).proportional()
-        buffer.flush()
-        buffer.seek(0)
+    def _get_buffer(avatar: memoryview, size: Optional[int] = None, max_bytes: Optional[int] = None) -> BytesIO:
+        img = Image.open(BytesIO(avatar))
 
-        img.save(buffer, 'png')
-        buffer.seek(0)
-        return buffer
+        # Render at a smaller working resolution
+        if size is not None and max(img.size) > size:
+            img.thumbnail((size, size), Image.LANCZOS)
+
+        img = ImageGen(img).proportional()
+        return encode_image(img, max_bytes)
 
     @commands.is_owner()
     @commands.cooldown(rate=1, per=5, type=commands.BucketType.user)
@@ -138,23 +172,21 @@ class Ukraine(commands.Cog):
         """Generates a Ukrainian colored ring border around someone's avatar"""
 
         async with ctx.typing():
-            try:
-                # Get avatar
-                avatar: bytes = await user.display_avatar.with_format('png').with_size(2048).read()
+            size = render_size()
+            asset = user.display_avatar.with_format('png').with_size(size)
+
+            file = await render_cached(ctx, 'ukraine', asset, self._get_buffer, size)
 
-                # Avoid blocking
-                img_buffer = await self.execute(self.executor, self._get_buffer, avatar)
+            # Send image
+            await ctx.reply(file=file)
 
-                # Send image
-                await ctx.reply(file=discord.File(fp=img_buffer, filename='image.png'))
 
-            finally:
-                # Free memory
-                img_buffer.close()
-                del img_buffer, avatar
+def warm_worker() -> None:
+    Ukraine._get_buffer(sample_image())
 
-    async def cog_unload(self) -> None:
-        self.executor.shutdown(wait=False)
+    # Masks and the flag at the configured size, so the first real render doesn't make them
+    size = render_size()
+    ImageGen(Image.new('RGBA', (size, size))).proportional()
 
 
 async def setup(client: MoistBot) -> None:
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+import aiohttp
+import discord
+
+from cogs.utils.cache import LRUCache
+
+logger = logging.getLogger('discord.' + __name__)
+
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+
+AvatarKey = tuple[str, str, Optional[int]]
+
+
+def avatar_key(asset: discord.Asset) -> AvatarKey:
+    """The asset key, format and size of an asset, which together identify its bytes."""
+    url = urlparse(asset.url)
+    size = parse_qs(url.query).get('size')
+    return asset.key, url.path.rpartition('.')[2], int(size[0]) if size else None
+
+
+class AvatarCache:
+    """Avatar bytes by asset key, format and size.
+
+    The asset key changes whenever the avatar does, so cached bytes never go stale.
+    Concurrent reads of the same avatar share one request.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.session: aiohttp.ClientSession = session
+        self.cache: LRUCache[AvatarKey, bytes] = LRUCache(max_bytes, weigher=len)
+        self._inflight: dict[AvatarKey, asyncio.Task[bytes]] = {}
+
+    async def _fetch(self, key: AvatarKey, url: str) -> bytes:
+        async with self.session.get(url) as resp:
+            if resp.status != 200:
+                if resp.status == 404:
+                    raise discord.NotFound(resp, 'asset not found')
+                if resp.status == 403:
+                    raise discord.Forbidden(resp, 'cannot retrieve asset')
+                raise discord.HTTPException(resp, 'failed to get asset')
+            data = await resp.read()
+
+        self.cache.set(key, data)
+        return data
+
+    def _done(self, key: AvatarKey, task: asyncio.Task[bytes]) -> None:
+        self._inflight.pop(key, None)
+
+        # Mark the error as retrieved in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    async def read(self, asset: discord.Asset) -> bytes:
+        """Returns the bytes of the asset, fetching it only if it's not cached or being fetched."""
+        key = avatar_key(asset)
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key, asset.url))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+
+        # A cancelled caller should not cancel the fetch for everyone else
+        return await asyncio.shield(task)
+
+    def __len__(self) -> int:
+        return len(self.cache)
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, NamedTuple, Optional, TypeVar, Union, overload
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+T = TypeVar('T')
+
+_MISSING = object()
+
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    size: int
+    maxsize: int
+    unit: str = 'entries'
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f'{self.hits}/{self.hits + self.misses} hits ({self.hit_rate:.0%}), '
+            f'{self.evictions} evicted, {self.size}/{self.maxsize} {self.unit}'
+        )
+
+
+class LRUCache(Generic[K, V]):
+    """A bounded least recently used cache with an optional time to live.
+
+    Keeps hit, miss and eviction counters so the hit rate can be monitored.
+    Expired entries are dropped lazily on lookup and count as evictions.
+
+    With a ``weigher``, ``maxsize`` bounds the total weight of the values
+    (e.g. ``weigher=len`` for a cache bounded in bytes) instead of the number of entries.
+    A value heavier than ``maxsize`` is not cached at all.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 128,
+        *,
+        ttl: Optional[float] = None,
+        weigher: Optional[Callable[[V], int]] = None,
+    ):
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1.')
+
+        self.maxsize: int = maxsize
+        self.ttl: Optional[float] = ttl
+        self.weigher: Optional[Callable[[V], int]] = weigher
+        self._data: OrderedDict[K, tuple[V, float]] = OrderedDict()
+        self._weight: int = 0
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def _is_expired(self, expires_at: float) -> bool:
+        return self.ttl is not None and time.monotonic() >= expires_at
+
+    def _weigh(self, value: V) -> int:
+        return self.weigher(value) if self.weigher is not None else 1
+
+    def _discard(self, key: K) -> tuple[V, float]:
+        entry = self._data.pop(key)
+        self._weight -= self._weigh(entry[0])
+        return entry
+
+    @overload
+    def get(self, key: K) -> Optional[V]:
+        ...
+
+    @overload
+    def get(self, key: K, default: T) -> Union[V, T]:
+        ...
+
+    def get(self, key: K, default=None):
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+
+        value, expires_at = entry  # type: ignore
+        if self._is_expired(expires_at):
+            self._discard(key)
+            self.evictions += 1
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: K, value: V) -> None:
+        if key in self._data:
+            self._discard(key)
+
+        weight = self._weigh(value)
+        if weight > self.maxsize:
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else 0.0
+        self._data[key] = (value, expires_at)
+        self._weight += weight
+
+        while self._weight > self.maxsize:
+            self._discard(next(iter(self._data)))
+            self.evictions += 1
+
+    def pop(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        if key not in self._data:
+            return default
+        return self._discard(key)[0]
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._weight = 0
+
+    @property
+    def weight(self) -> int:
+        """The total weight of the values, the number of entries without a weigher."""
+        return self._weight
+
+    @property
+    def stats(self) -> CacheStats:
+        unit = 'entries' if self.weigher is None else 'weight'
+        return CacheStats(self.hits, self.misses, self.evictions, self._weight, self.maxsize, unit)
+
+    def __contains__(self, key: object) -> bool:
+        entry = self._data.get(key)  # type: ignore
+        return entry is not None and not self._is_expired(entry[1])
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} maxsize={self.maxsize} ttl={self.ttl} size={len(self._data)}>'
@@ -5,8 +5,14 @@ from typing import TYPE_CHECKING, Optional, TypeAlias, Union, overload
 from urllib import error as url_error
 from urllib.parse import urlparse
 
+import discord
+from discord.ext import commands
+
 if TYPE_CHECKING:
+    import aiohttp
+
     from cogs.utils.context import Context
+    from main import MoistBot
 
 
 N: TypeAlias = Union[int, float]
@@ -39,29 +45,141 @@ def is_url(text: str) -> bool:
         return False
 
 
+DEFAULT_MAX_MEDIA_SIZE = 8 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# Enough bytes to recognize every supported image format
+HEADER_SIZE = 12
+
+
+class MediaTooLarge(commands.BadArgument):
+    def __init__(self, max_size: int):
+        super().__init__(f':warning: Media must be smaller than {max_size / 1024 / 1024:.1f} MiB.')
+
+
+class NotAnImage(commands.BadArgument):
+    def __init__(self):
+        super().__init__(':warning: That is not a supported image.')
+
+
+def sniff_image(header: bytes) -> Optional[str]:
+    """Returns the image format from the first :data:`HEADER_SIZE` bytes, ``None`` if it is not an image."""
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if header.startswith((b'GIF87a', b'GIF89a')):
+        return 'gif'
+    if header.startswith(b'RIFF') and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+async def read_media(
+    session: aiohttp.ClientSession,
+    url: str,
+    *,
+    max_size: int = DEFAULT_MAX_MEDIA_SIZE,
+    size_hint: Optional[int] = None,
+    buffer: Optional[BytesIO] = None,
+) -> Optional[BytesIO]:
+    """Streams an image into a buffer, rejecting it as early as possible.
+
+    The size is checked against ``max_size`` before downloading when it's known up front,
+    either from ``size_hint`` or the Content-Length, and again while streaming.
+    The header is checked as soon as it arrives. Returns ``None`` if the media is empty.
+
+    Raises:
+        MediaTooLarge: The media is larger than ``max_size``.
+        NotAnImage: The media is not a supported image.
+        discord.HTTPException: The media could not be fetched.
+    """
+    buffer = buffer or BytesIO()
+
+    async with session.get(url) as resp:
+        if resp.status != 200:
+            raise discord.HTTPException(resp, 'failed to get media')
+
+        size = resp.content_length or size_hint
+        if size:
+            if size > max_size:
+                raise MediaTooLarge(max_size)
+
+            # Grow the buffer once, the chunks are then written in place
+            buffer.seek(size - 1)
+            buffer.write(b'\0')
+            buffer.seek(0)
+
+        written = 0
+        async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+            if written < HEADER_SIZE <= written + len(chunk):
+                header = buffer.getbuffer()[:written].tobytes() + chunk[:HEADER_SIZE - written]
+                if sniff_image(header) is None:
+                    raise NotAnImage()
+
+            written += len(chunk)
+            if written > max_size:
+                raise MediaTooLarge(max_size)
+            buffer.write(chunk)
+
+    if not written:
+        return None
+
+    if written < HEADER_SIZE and sniff_image(buffer.getbuffer()[:written].tobytes()) is None:
+        raise NotAnImage()
+
+    buffer.truncate(written)
+    buffer.seek(0)
+    return buffer
+
+
+async def read_attachment(
+    session: aiohttp.ClientSession,
+    attachment: discord.Attachment,
+    *,
+    max_size: int = DEFAULT_MAX_MEDIA_SIZE,
+    buffer: Optional[BytesIO] = None,
+) -> Optional[BytesIO]:
+    """Streams an attachment with :func:`read_media`, its size is known before downloading."""
+    if attachment.size > max_size:
+        raise MediaTooLarge(max_size)
+    return await read_media(
+        session, attachment.proxy_url, max_size=max_size, size_hint=attachment.size, buffer=buffer
+    )
+
+
+def max_media_size(bot: MoistBot) -> int:
+    """The download cap of media, ``MAX_MEDIA_SIZE`` in the config."""
+    return getattr(bot.config, 'MAX_MEDIA_SIZE', DEFAULT_MAX_MEDIA_SIZE)
+
+
 async def get_media_from_ctx(
     ctx: Context,
     arg: Optional[str] = None,
-    buffer: Optional[BytesIO] = None
+    buffer: Optional[BytesIO] = None,
+    *,
+    max_size: Optional[int] = None,
 ) -> Optional[BytesIO]:
+    """Streams the image from the URL argument, or the attachment or URL of the replied message.
 
-    buffer = buffer or BytesIO()
+    ``max_size`` defaults to ``MAX_MEDIA_SIZE`` in the config.
+    """
     reply = ctx.replied_message
     bot = ctx.bot
-    media = b''
+    if max_size is None:
+        max_size = max_media_size(bot)
 
-    # Fetch media bytes
+    # Find the media
+    url: Optional[str] = None
     if arg and is_url(arg):
-        media = await bot.http.get_from_cdn(arg)
+        url = arg
     elif reply:
         if reply.attachments:
-            media = await reply.attachments[0].read(use_cached=True)
+            return await read_attachment(bot.session, reply.attachments[0], max_size=max_size, buffer=buffer)
         elif is_url(reply.content):
-            media = await bot.http.get_from_cdn(reply.content)
+            url = reply.content
 
-    if not media:
+    if url is None:
         return None
 
-    buffer.write(media)
-    buffer.seek(0)
-    return buffer
+    return await read_media(bot.session, url, max_size=max_size, buffer=buffer)
@@ -1,108 +1,168 @@
-from typing import Any, Dict, List, Optional, TypeVar
+from __future__ import annotations
 
-import aiofiles
+import os
 import asyncio
+import logging
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Self
+
+import aiofiles
 import orjson
 
-_T = TypeVar('_T', bound=Dict[str, Any])
+if TYPE_CHECKING:
+    from aiofiles.threadpool.binary import AsyncBufferedIOBase
+
+logger = logging.getLogger('discord.' + __name__)
 
 
 class AsyncJsonDB:
-    """An async database handler based on ``json`` internally.
+    """An async key-value store based on ``json`` internally.
+
+    The in-memory dict is the source of truth, writes are appended to an
+    operation log next to the snapshot file and periodically compacted into it.
+    Every write is O(1) instead of rewriting the whole file.
 
     Not designed to hold a large amount of data.
     Mostly meant for saving cache to file.
+
+    Use :meth:`open` to create one.
     """
 
-    def __init__(self, filepath: str):
-        self.filepath = filepath
+    def __init__(
+        self,
+        filepath: str,
+        *,
+        compact_interval: float = 300.0,
+        compact_threshold: int = 1_000,
+    ):
+        self.filepath: str = filepath
+        self.log_filepath: str = filepath + '.log'
+        self.compact_interval: float = compact_interval
+        self.compact_threshold: int = compact_threshold
+
+        self.data: Dict[str, Any] = {}
         self.lock = asyncio.Lock()
-        self.queue = asyncio.Queue()
-        self.execute = asyncio.get_running_loop().run_in_executor
-
-        # Start the queue processing task
-        self.worker =  asyncio.create_task(self.process_queue())
 
-        # Cache latest db to avoid unnecessary re-acquirement
-        self.data: Dict[str, Any] = await self.read_data()
+        # Number of operations in the log since the last compaction
+        self._log_ops: int = 0
+        self._log: Optional[AsyncBufferedIOBase] = None
+        self._worker: Optional[asyncio.Task[None]] = None
 
-        # Keep track of when the db has to re-acquire itself from file
-        self.db_changed: bool = True  # TODO: Handle states
+    @classmethod
+    async def open(cls, filepath: str, **kwargs: Any) -> Self:
+        """Loads the snapshot, replays the operation log and starts compacting in the background."""
+        self = cls(filepath, **kwargs)
+        await self._load()
 
+        self._log = await aiofiles.open(self.log_filepath, 'ab')
+        self._worker = asyncio.create_task(self._compact_periodically())
+        return self
 
-    async def get(self, key: str) -> Optional[_T]:
-        return await self.execute_operation(self._get, key)
+    async def get(self, key: str) -> Optional[Any]:
+        return self.data.get(key)
 
     async def set(self, key: str, value: Any) -> None:
-        await self.execute_operation(self._set, key, value)
+        self.data[key] = value
+        await self._append(('set', key, value))
+
+    async def set_many(self, items: Iterable[tuple[str, Any]]) -> None:
+        """Sets many keys with a single write to the operation log."""
+        ops = []
+        for key, value in items:
+            self.data[key] = value
+            ops.append(('set', key, value))
+        await self._append(*ops)
 
     async def keys(self) -> List[str]:
-        return await self.execute_operation(self._keys)
+        return list(self.data.keys())
 
     async def delete(self, key: str) -> None:
-        await self.execute_operation(self._delete, key)
+        if key in self.data:
+            del self.data[key]
+            await self._append(('del', key))
 
     async def clear(self) -> None:
-        await self.execute_operation(self._clear)
+        self.data.clear()
+        await self._append(('clear',))
+
+    def _apply(self, op: list[Any]) -> None:
+        name, *args = op
+        if name == 'set':
+            key, value = args
+            self.data[key] = value
+        elif name == 'del':
+            self.data.pop(args[0], None)
+        elif name == 'clear':
+            self.data.clear()
+
+    async def _load(self) -> None:
+        try:
+            async with aiofiles.open(self.filepath, 'rb') as f:
+                self.data = orjson.loads(await f.read() or b'{}')
+        except FileNotFoundError:
+            self.data = {}
+
+        try:
+            async with aiofiles.open(self.log_filepath, 'rb') as f:
+                lines = (await f.read()).splitlines()
+        except FileNotFoundError:
+            return
+
+        for i, line in enumerate(lines):
+            try:
+                self._apply(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                # A crash mid-write can only leave the last line incomplete
+                if i != len(lines) - 1:
+                    raise
+                logger.warning(f'Ignoring truncated operation at the end of {self.log_filepath}')
 
-    async def execute_operation(self, operation, *args) -> Any:
-        future = asyncio.Future()
-        await self.queue.put((operation, args, future))
-        return await future
+        self._log_ops = len(lines)
+
+    async def _append(self, *ops: tuple[Any, ...]) -> None:
+        if self._log is None:
+            raise RuntimeError(f'{self.__class__.__name__} was not opened, use {self.__class__.__name__}.open')
+        if not ops:
+            return
 
-    async def process_queue(self) -> None:
-        while True:
-            operation, args, future = await self.queue.get()
-            try:
-                # Execute the operation and set the future result
-                result = await operation(*args)
-                future.set_result(result)
-            except Exception as e:
-                # Set the future exception
-                future.set_exception(e)
-            finally:
-                # Notify the queue that the operation is complete
-                self.queue.task_done()
-    async def read_data(self) -> _T:
         async with self.lock:
-            try:
-                async with aiofiles.open(self.filepath, 'r') as f:
-                    data = orjson.loads(await f.read())
-            except FileNotFoundError:
-                data = {}
-        return data
+            await self._log.write(b''.join(orjson.dumps(op) + b'\n' for op in ops))
+            await self._log.flush()
+            self._log_ops += len(ops)
 
-    async def write_data(self, data: _T) -> None:
+    async def compact(self) -> None:
+        """Writes the current data to the snapshot file and truncates the operation log."""
         async with self.lock:
-            async with aiofiles.open(self.filepath, 'wb') as f:
-                await f.write(await self.execute(None, orjson.dumps, data))
-
-    async def _resolve_data(self, data: Optional[_T]) -> _T:
-        """Read data from file if no data is present"""
-        if not data:
-            return await self.read_data()
-        return data
-
-    async def _get(self, key: str, data: Optional[_T] = None) -> Optional[Any]:
-        data = await self._resolve_data(data)
-        return data.get(key)
-
-    async def _set(self, key: str, value: Any, data: Optional[_T]) -> None:
-        data = await self._resolve_data(data)
-        data[key] = value
-        await self.write_data(data)
-
-    async def _delete(self, key: str, data: Optional[_T]) -> None:
-        data = await self._resolve_data(data)
-        data.pop(key, None)
-        await self.write_data(data)
-
-    async def _keys(self, data: Optional[_T]) -> List[str]:
-        data = await self._resolve_data(data)
-        return list(data.keys())
-
-    async def _clear(self) -> None:
-        await self.write_data({})
-
-    def __del__(self):
-        self.worker.cancel()
+            if not self._log_ops:
+                return
+
+            # Replace the snapshot atomically, replaying the log over it is harmless
+            tmp_filepath = self.filepath + '.tmp'
+            async with aiofiles.open(tmp_filepath, 'wb') as f:
+                await f.write(orjson.dumps(self.data))
+            os.replace(tmp_filepath, self.filepath)
+
+            if self._log is not None:
+                await self._log.close()
+            self._log = await aiofiles.open(self.log_filepath, 'wb')
+            self._log_ops = 0
+
+    async def _compact_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.compact_interval)
+            if self._log_ops >= self.compact_threshold:
+                try:
+                    await self.compact()
+                except OSError:
+                    logger.exception(f'Failed to compact {self.filepath}')
+
+    async def close(self) -> None:
+        """Stops the background compaction and compacts one last time."""
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+        await self.compact()
+
+        if self._log is not None:
+            await self._log.close()
+            self._log = None
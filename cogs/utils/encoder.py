@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import math
+from io import BytesIO
+from typing import TYPE_CHECKING, Optional, Union
+
+import discord
+from discord.ext import commands
+from PIL import Image
+
+from cogs.utils.converters import HEADER_SIZE, sniff_image
+
+if TYPE_CHECKING:
+    from main import MoistBot
+
+# Room for the message and embed sent along with the file
+UPLOAD_OVERHEAD = 64 * 1024
+
+# Discord's upload limit without boosts. discord.py can report more than Discord enforces,
+# so guild limits are capped by ``MAX_UPLOAD_BYTES`` in the config
+DEFAULT_MAX_UPLOAD = 10 * 1024 * 1024
+
+# The fastest PNG level is only used when the raw pixels take at most this share of the budget.
+# Its output can't be much larger than the raw pixels, so it's sure to fit with room to spare.
+FAST_PNG_RATIO = 0.5
+
+LOSSY_QUALITY = 90
+MAX_DOWNSCALES = 3
+MIN_DOWNSCALE_SIZE = 64
+
+
+class OutputTooLarge(commands.BadArgument):
+    """Raised when a generated image can't be made small enough to upload."""
+
+    def __init__(self, message: str = ':warning: The image is too large to upload here.'):
+        super().__init__(message)
+
+
+def max_upload_size(bot: MoistBot) -> int:
+    """The largest upload to expect anywhere, ``MAX_UPLOAD_BYTES`` in the config."""
+    return getattr(bot.config, 'MAX_UPLOAD_BYTES', DEFAULT_MAX_UPLOAD)
+
+
+def upload_budget(guild: Optional[discord.Guild], max_upload: int = DEFAULT_MAX_UPLOAD) -> int:
+    """Largest file in bytes that can be uploaded to the guild, or in private messages."""
+    limit = guild.filesize_limit if guild is not None else max_upload
+    return min(limit, max_upload) - UPLOAD_OVERHEAD
+
+
+def image_filename(stem: str, data: Union[bytes, memoryview]) -> str:
+    """The filename with the extension of the format the image was encoded in."""
+    return f'{stem}.{sniff_image(bytes(data[:HEADER_SIZE])) or "png"}'
+
+
+def ensure_fits(buffer: BytesIO, max_bytes: int) -> BytesIO:
+    """Raises :exc:`OutputTooLarge` instead of letting the upload fail."""
+    if buffer.getbuffer().nbytes > max_bytes:
+        raise OutputTooLarge()
+    return buffer
+
+
+def _save(img: Image.Image, format: str, **params) -> BytesIO:
+    buffer = BytesIO()
+    img.save(buffer, format, **params)
+    buffer.seek(0)
+    return buffer
+
+
+def _is_opaque(img: Image.Image) -> bool:
+    if img.mode in ('RGB', 'L'):
+        return True
+    if img.mode == 'RGBA':
+        return img.getextrema()[3][0] == 255
+    return False
+
+
+def _save_lossy(img: Image.Image) -> BytesIO:
+    # JPEG is an order of magnitude faster to encode, WebP keeps transparency
+    if _is_opaque(img):
+        return _save(img.convert('RGB'), 'JPEG', quality=LOSSY_QUALITY)
+    return _save(img.convert('RGBA'), 'WEBP', quality=LOSSY_QUALITY, method=0)
+
+
+def encode_image(img: Image.Image, max_bytes: Optional[int] = None) -> BytesIO:
+    """Encodes an image as small as it needs to be to fit in ``max_bytes``.
+
+    Images far under the budget use the fastest PNG level, the others the default one.
+    A PNG over budget is encoded in a lossy format, then in the lossy format at smaller
+    sizes. Every step is only taken when the previous output was too large, so most
+    images are encoded once. The output can still be over budget, check it with
+    :func:`ensure_fits`.
+    """
+    raw_size = img.width * img.height * len(img.getbands())
+    fast = max_bytes is not None and raw_size <= max_bytes * FAST_PNG_RATIO
+
+    buffer = _save(img, 'PNG', compress_level=1 if fast else 6)
+    if max_bytes is None:
+        return buffer
+
+    size = buffer.getbuffer().nbytes
+    if size <= max_bytes:
+        return buffer
+
+    buffer = _save_lossy(img)
+    size = buffer.getbuffer().nbytes
+
+    for _ in range(MAX_DOWNSCALES):
+        if size <= max_bytes or min(img.size) <= MIN_DOWNSCALE_SIZE:
+            break
+
+        # Size shrinks roughly with the area, aim a bit under the budget
+        scale = math.sqrt(max_bytes / size) * 0.9
+        new_size = max(1, round(img.width * scale)), max(1, round(img.height * scale))
+        img = img.resize(new_size, Image.Resampling.BICUBIC, reducing_gap=2.0)
+
+        buffer = _save_lossy(img)
+        size = buffer.getbuffer().nbytes
+
+    return buffer
@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+from array import array
+from typing import Iterable, TypeAlias, Union
+
+N: TypeAlias = Union[int, float]
+
+
+def pack_floats(values: Iterable[N]) -> bytes:
+    """Packs numbers into a native float64 blob."""
+    return array('d', values).tobytes()
+
+
+def unpack_floats(data: bytes) -> list[float]:
+    """Unpacks a blob created by :func:`pack_floats` without any parsing."""
+    return memoryview(data).cast('d').tolist()
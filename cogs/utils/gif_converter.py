@@ -1,20 +1,20 @@
-from collections import defaultdict
-from random import randrange
-from itertools import chain
 from typing import Optional
 
+import numpy as np
 from PIL.Image import Image
 
 
 class TransparentAnimatedGifConverter:
-    _PALETTE_SLOT_SET = set(range(256))
+    _PALETTE_SIZE = 256
 
     def __init__(self, img_rgba: Optional[Image] = None, alpha_threshold: int = 0):
         self._alpha_threshold = alpha_threshold
         self._img_rgba = img_rgba
 
-        self._palette_replaces = None
+        self._transparent = None
         self._img_p_data = None
+        self._palette = None
+        self._used = None
         self._img_p = None
 
     @property
@@ -26,99 +26,71 @@ class TransparentAnimatedGifConverter:
         self._img_rgba = value
 
     def _process_pixels(self) -> None:
-        """Set the transparent pixels to the color 0."""
-        self._transparent_pixels = set(
-            idx
-            for idx, alpha in enumerate(
-                self._img_rgba.getchannel(channel='A').getdata()
-            )
-            if alpha <= self._alpha_threshold
-        )
+        """Find the transparent pixels."""
+        alpha = np.asarray(self._img_rgba.getchannel(channel='A'))
+        self._transparent = alpha <= self._alpha_threshold
 
     def _set_parsed_palette(self) -> None:
-        """Parse the RGB palette color `tuple`s from the palette."""
-        palette = self._img_p.getpalette()
-        self._img_p_used_palette_idxs = set(
-            idx
-            for pal_idx, idx in enumerate(self._img_p_data)
-            if pal_idx not in self._transparent_pixels
-        )
-        self._img_p_parsed_palette = dict(
-            (idx, tuple(palette[idx * 3 : idx * 3 + 3]))
-            for idx in self._img_p_used_palette_idxs
-        )
+        """Parse the RGB palette colors and which of them are used by opaque pixels."""
+        palette = np.zeros((self._PALETTE_SIZE, 3), dtype=np.uint8)
+        colors = np.frombuffer(bytes(self._img_p.getpalette()), dtype=np.uint8).reshape(-1, 3)
+        palette[:len(colors)] = colors[:self._PALETTE_SIZE]
+        self._palette = palette
+
+        opaque = self._img_p_data[~self._transparent]
+        self._used = np.bincount(opaque, minlength=self._PALETTE_SIZE) > 0
 
     def _get_similar_color_idx(self) -> int:
         """Return a palette index with the closest similar color."""
-        old_color = self._img_p_parsed_palette[0]
-        dict_distance = defaultdict(list)
-        for idx in range(1, 256):
-            color_item = self._img_p_parsed_palette[idx]
-            if color_item == old_color:
-                return idx
-            distance = sum(
-                (
-                    abs(old_color[0] - color_item[0]),  # Red
-                    abs(old_color[1] - color_item[1]),  # Green
-                    abs(old_color[2] - color_item[2]),
-                )
-            )  # Blue
-            dict_distance[distance].append(idx)
-        return dict_distance[sorted(dict_distance)[0]][0]
+        distances = np.abs(
+            self._palette[1:].astype(np.int16) - self._palette[0].astype(np.int16)
+        ).sum(axis=1)
+        return int(np.argmin(distances)) + 1
 
     def _remap_palette_idx_zero(self) -> None:
         """Since the first color is used in the palette, remap it."""
-        free_slots = self._PALETTE_SLOT_SET - self._img_p_used_palette_idxs
-        new_idx = free_slots.pop() if free_slots else self._get_similar_color_idx()
-        self._img_p_used_palette_idxs.add(new_idx)
-        self._palette_replaces['idx_from'].append(0)
-        self._palette_replaces['idx_to'].append(new_idx)
-        self._img_p_parsed_palette[new_idx] = self._img_p_parsed_palette[0]
-        del self._img_p_parsed_palette[0]
-
-    def _get_unused_color(self) -> tuple:
-        """Return a color for the palette that does not collide with any other already in the palette.
-        """
-        used_colors = set(self._img_p_parsed_palette.values())
-        while True:
-            new_color = (randrange(256), randrange(256), randrange(256))
-            if new_color not in used_colors:
-                return new_color
+        free_slots = np.flatnonzero(~self._used)
+        new_idx = int(free_slots[0]) if free_slots.size else self._get_similar_color_idx()
+
+        self._img_p_data[self._img_p_data == 0] = new_idx
+        self._palette[new_idx] = self._palette[0]
+        self._used[new_idx] = True
+        self._used[0] = False
+
+    def _get_unused_colors(self, amount: int) -> np.ndarray:
+        """Return colors that do not collide with any other already in the palette."""
+        used_colors = self._palette[self._used].astype(np.int32)
+        used_keys = (used_colors[:, 0] << 16) | (used_colors[:, 1] << 8) | used_colors[:, 2]
+
+        # At most 256 colors are used, so the first 256 + amount candidates always suffice
+        keys = np.setdiff1d(np.arange(self._PALETTE_SIZE + amount), used_keys)[:amount]
+        return np.stack(((keys >> 16) & 0xFF, (keys >> 8) & 0xFF, keys & 0xFF), axis=1).astype(np.uint8)
 
     def _process_palette(self) -> None:
         """Adjust palette to have the zeroth color set as transparent.
         Basically, get another palette index for the zeroth color.
         """
         self._set_parsed_palette()
-        if 0 in self._img_p_used_palette_idxs:
+        if self._used[0]:
             self._remap_palette_idx_zero()
-        self._img_p_parsed_palette[0] = self._get_unused_color()
 
     def _adjust_pixels(self) -> None:
         """Convert the pixels into their new values."""
-        if self._palette_replaces['idx_from']:
-            trans_table = bytearray.maketrans(
-                bytes(self._palette_replaces['idx_from']),
-                bytes(self._palette_replaces['idx_to']),
-            )
-            self._img_p_data = self._img_p_data.translate(trans_table)
-        for idx_pixel in self._transparent_pixels:
-            self._img_p_data[idx_pixel] = 0
-        self._img_p.frombytes(data=bytes(self._img_p_data))
+        self._img_p_data[self._transparent] = 0
+        self._img_p.frombytes(data=self._img_p_data.tobytes())
 
     def _adjust_palette(self) -> None:
         """Modify the palette in the new `Image`."""
-        unused_color = self._get_unused_color()
-        final_palette = chain.from_iterable(
-            self._img_p_parsed_palette.get(x, unused_color) for x in range(256)
-        )
-        self._img_p.putpalette(data=final_palette)
+        transparent_color, unused_color = self._get_unused_colors(2)
+
+        final_palette = np.where(self._used[:, None], self._palette, unused_color)
+        final_palette[0] = transparent_color
+        self._img_p.putpalette(data=final_palette.tobytes())
 
     def process(self) -> Image:
         """Return the processed mode `P` `Image`."""
         self._img_p = self._img_rgba.convert(mode='P')
-        self._img_p_data = bytearray(self._img_p.tobytes())
-        self._palette_replaces = dict(idx_from=list(), idx_to=list())
+        self._img_p_data = np.array(self._img_p, dtype=np.uint8)
         self._process_pixels()
         self._process_palette()
         self._adjust_pixels()
@@ -126,3 +98,4 @@ class TransparentAnimatedGifConverter:
         self._img_p.info['transparency'] = 0
         self._img_p.info['background'] = 0
         return self._img_p
+
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import os
+import hashlib
+import logging
+from io import BytesIO
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional, Union
+
+import aiofiles
+import discord
+
+from cogs.utils.cache import LRUCache
+from cogs.utils.encoder import ensure_fits, image_filename, max_upload_size, upload_budget
+
+if TYPE_CHECKING:
+    from cogs.utils.context import Context
+    from cogs.utils.image_jobs import ImageFunc
+
+logger = logging.getLogger('discord.' + __name__)
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_DISK_BYTES = 512 * 1024 * 1024
+
+ImageSource = Union[discord.Asset, discord.Attachment, bytes, str, int]
+
+
+def source_key(source: ImageSource) -> str:
+    """A key identifying the contents of a source image without downloading it.
+
+    Asset keys change when the avatar changes and attachments are immutable,
+    so neither has to be fetched to be identified. Raw bytes are hashed.
+    """
+    if isinstance(source, discord.Asset):
+        return f'asset:{source.key}'
+    if isinstance(source, discord.Attachment):
+        return f'attachment:{source.id}'
+    if isinstance(source, bytes):
+        return 'blake2b:' + hashlib.blake2b(source, digest_size=16).hexdigest()
+    return str(source)
+
+
+class ImageResultCache:
+    """Content addressed cache of generated images.
+
+    Results are keyed by the command, the source image and the parameters,
+    kept in a memory LRU bounded in bytes and optionally in a directory bounded in bytes.
+    Memory misses that hit the disk are promoted back into memory.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        *,
+        directory: Optional[str] = None,
+        max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES,
+    ):
+        self.memory: LRUCache[str, bytes] = LRUCache(max_bytes, weigher=len)
+        self.directory: Optional[str] = directory
+        self.max_disk_bytes: int = max_disk_bytes
+
+        # Files on disk by least recently written, with their sizes
+        self._disk: OrderedDict[str, int] = OrderedDict()
+        self._disk_bytes: int = 0
+        if directory is not None:
+            self._scan_directory(directory)
+
+    @staticmethod
+    def make_key(command: str, source: ImageSource, *params: Any) -> str:
+        raw = repr((command, source_key(source), params)).encode()
+        return hashlib.blake2b(raw, digest_size=20).hexdigest()
+
+    def _scan_directory(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+
+        entries = sorted(
+            (entry for entry in os.scandir(directory) if entry.is_file() and not entry.name.endswith('.tmp')),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in entries:
+            size = entry.stat().st_size
+            self._disk[entry.name] = size
+            self._disk_bytes += size
+
+        self._evict_disk()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)  # type: ignore
+
+    def _evict_disk(self) -> None:
+        while self._disk_bytes > self.max_disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    async def get(self, key: str) -> Optional[bytes]:
+        data = self.memory.get(key)
+        if data is not None or key not in self._disk:
+            return data
+
+        try:
+            async with aiofiles.open(self._path(key), 'rb') as f:
+                data = await f.read()
+        except FileNotFoundError:
+            self._disk_bytes -= self._disk.pop(key)
+            return None
+
+        self.memory.set(key, data)
+        return data
+
+    async def set(self, key: str, data: bytes) -> None:
+        self.memory.set(key, data)
+        if self.directory is None or key in self._disk:
+            return
+
+        # Write atomically so a crash never leaves a truncated image behind
+        path = self._path(key)
+        try:
+            async with aiofiles.open(path + '.tmp', 'wb') as f:
+                await f.write(data)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            logger.exception(f'Failed to write cached image {key}')
+            return
+
+        self._disk[key] = len(data)
+        self._disk_bytes += len(data)
+        self._evict_disk()
+
+    async def get_file(self, key: str, stem: str) -> Optional[discord.File]:
+        """Returns the cached result as a ready to send file, named after the format it was encoded in."""
+        data = await self.get(key)
+        if data is None:
+            return None
+        return discord.File(BytesIO(data), filename=image_filename(stem, data))
+
+    def __len__(self) -> int:
+        return len(self.memory)
+
+    def __repr__(self) -> str:
+        return (
+            f'<{self.__class__.__name__} memory={self.memory.weight}/{self.memory.maxsize} '
+            f'disk={self._disk_bytes}/{self.max_disk_bytes if self.directory else 0}>'
+        )
+
+
+async def render_cached(
+    ctx: Context,
+    command: str,
+    source: ImageSource,
+    func: ImageFunc,
+    *params: Any,
+    stem: str = 'image',
+    fetch: Optional[Callable[[], Awaitable[Optional[Union[bytes, memoryview]]]]] = None,
+) -> Optional[discord.File]:
+    """Renders ``func(image, *params, budget)`` for the author, or reuses a cached result.
+
+    The budget is the upload limit of the context, and is part of the cache key along
+    with the command, the source and the parameters. The source is read through the
+    avatar cache unless ``fetch`` is given.
+
+    Returns:
+        Optional[discord.File]: The image named after its format, ``None`` if ``fetch`` found nothing.
+
+    Raises:
+        OutputTooLarge: The image can't be made small enough to upload.
+        RenderBusy: The render queue is full.
+    """
+    bot = ctx.bot
+    budget = upload_budget(ctx.guild, max_upload_size(bot))
+
+    key = bot.image_cache.make_key(command, source, *params, budget)
+    file = await bot.image_cache.get_file(key, stem)
+    if file is not None:
+        return file
+
+    data = await fetch() if fetch is not None else await bot.avatar_cache.read(source)
+    if data is None:
+        return None
+
+    # Off the event loop
+    buffer = await bot.render_scheduler.submit(ctx.author.id, func, data, *params, budget)
+    ensure_fits(buffer, budget)
+    await bot.image_cache.set(key, buffer.getvalue())
+
+    return discord.File(buffer, filename=image_filename(stem, buffer.getbuffer()))
@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import importlib
+from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import Executor, Future
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Optional, Sequence, Union
+
+from PIL import Image
+
+logger = logging.getLogger('discord.' + __name__)
+
+MIN_SEGMENT_SIZE = 1024 * 1024
+MAX_IDLE_SEGMENTS = 8
+
+ImageFunc = Callable[..., BytesIO]
+
+# Modules with job functions, loaded by every worker on start
+IMAGE_MODULES = ('cogs.petpet', 'cogs.lqpfp', 'cogs.ukraine', 'cogs.gay')
+
+# Segments attached by this worker process, by name
+_attached: OrderedDict[str, SharedMemory] = OrderedDict()
+_MAX_ATTACHED = MAX_IDLE_SEGMENTS + 2  # Backstop, mappings are pruned on every job
+
+
+def _segment_size(size: int) -> int:
+    """Rounds up to a power of two so segments can be reused for similar sizes."""
+    return max(MIN_SEGMENT_SIZE, 1 << (size - 1).bit_length())
+
+
+def _attach(name: str) -> SharedMemory:
+    """Attaches to a segment of the parent process, reusing the mapping for pooled segments."""
+    shm = _attached.get(name)
+    if shm is not None:
+        _attached.move_to_end(name)
+        return shm
+
+    # The parent owns the segment, the tracker must not unlink it when this worker exits
+    if sys.version_info >= (3, 13):
+        shm = SharedMemory(name, track=False)
+    else:
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args, **kwargs: None
+        try:
+            shm = SharedMemory(name)
+        finally:
+            resource_tracker.register = register
+
+    _attached[name] = shm
+    while len(_attached) > _MAX_ATTACHED:
+        _, old = _attached.popitem(last=False)
+        old.close()
+    return shm
+
+
+def _prune(live: frozenset[str]) -> None:
+    """Closes the mappings of segments the parent no longer pools, so they aren't kept alive."""
+    for name in [name for name in _attached if name not in live]:
+        _attached.pop(name).close()
+
+
+def _run_job(
+    func: ImageFunc, input_name: str, input_size: int, output_name: str, live: frozenset[str], *args: Any
+) -> Union[int, bytes]:
+    """Runs in the worker. Returns the output size, or the output itself if it does not fit.
+
+    ``live`` has the names of the segments the parent still pools, any other mapping is closed.
+    """
+    _prune(live)
+
+    view = _attach(input_name).buf[:input_size]
+    try:
+        buffer = func(view, *args)
+    finally:
+        view.release()
+
+    data = buffer.getbuffer()
+    output = _attach(output_name)
+    try:
+        if len(data) > output.size:
+            return bytes(data)
+        output.buf[:len(data)] = data
+        return len(data)
+    finally:
+        data.release()
+
+
+def sample_image(size: int = 64, format: str = 'png') -> memoryview:
+    """A small opaque image for warming up job functions."""
+    buffer = BytesIO()
+    Image.new('RGBA', (size, size), color=(128, 128, 128, 255)).save(buffer, format)
+    return buffer.getbuffer()
+
+
+def init_worker(modules: Sequence[str]) -> None:
+    """Process pool initializer that loads the image modules and their assets up front.
+
+    Modules can define a ``warm_worker()`` function to prepare per-process caches.
+    A failing module is logged and skipped so it can't break the whole pool.
+    """
+    Image.init()
+
+    for name in modules:
+        try:
+            module = importlib.import_module(name)
+            warm_worker = getattr(module, 'warm_worker', None)
+            if warm_worker is not None:
+                warm_worker()
+        except Exception:
+            logger.exception(f'Failed to warm {name} in worker')
+
+
+def _ping(delay: float) -> int:
+    # Keep the worker busy so every ping lands on a different process
+    time.sleep(delay)
+    return os.getpid()
+
+
+def _run_pickled(func: ImageFunc, data: bytes, *args: Any) -> BytesIO:
+    return func(memoryview(data), *args)
+
+
+class ImageJobRunner:
+    """Runs image jobs in a process pool, passing inputs and outputs through shared memory.
+
+    Segments are pooled and reused, and workers keep them mapped while they are
+    pooled, so a job only copies its input into a segment and its output out of
+    one instead of pickling both through the pool's pipes.
+
+    Job functions are called in the worker with a ``memoryview`` of the input
+    and must return a ``BytesIO``.
+    """
+
+    def __init__(self, executor: Executor, *, max_idle_segments: int = MAX_IDLE_SEGMENTS):
+        self.executor: Executor = executor
+        self.max_idle_segments: int = max_idle_segments
+        self._idle: list[SharedMemory] = []
+        self._closed: bool = False
+
+    def _acquire(self, size: int) -> SharedMemory:
+        # Smallest idle segment that fits
+        fitting = [shm for shm in self._idle if shm.size >= size]
+        if fitting:
+            shm = min(fitting, key=lambda shm: shm.size)
+            self._idle.remove(shm)
+            return shm
+        return SharedMemory(create=True, size=_segment_size(size))
+
+    def _release(self, *segments: SharedMemory) -> None:
+        for shm in segments:
+            if not self._closed and len(self._idle) < self.max_idle_segments:
+                self._idle.append(shm)
+            else:
+                shm.close()
+                shm.unlink()
+
+    async def run(
+        self,
+        func: ImageFunc,
+        data: Union[bytes, bytearray, memoryview],
+        *args: Any,
+        output_size: Optional[int] = None,
+        executor: Optional[Executor] = None,
+    ) -> BytesIO:
+        """Runs ``func(memoryview, *args)`` in the process pool.
+
+        ``output_size`` is the expected size of the output, four times the input by default.
+        Larger outputs are still returned, just pickled.
+        """
+        executor = executor or self.executor
+        loop = asyncio.get_running_loop()
+
+        segments: list[SharedMemory] = []
+        try:
+            for size in (len(data), output_size or 4 * len(data)):
+                segments.append(self._acquire(size))
+        except OSError:
+            logger.exception('Failed to allocate shared memory, falling back to pickling')
+            self._release(*segments)
+            return await loop.run_in_executor(executor, _run_pickled, func, bytes(data), *args)
+
+        input_shm, output_shm = segments
+
+        input_shm.buf[:len(data)] = data
+
+        # Segments the workers may keep mapped, the others were or will be unlinked
+        live = frozenset([input_shm.name, output_shm.name, *(shm.name for shm in self._idle)])
+
+        future: Future = executor.submit(
+            _run_job, func, input_shm.name, len(data), output_shm.name, live, *args
+        )
+        try:
+            result = await asyncio.wrap_future(future)
+            if isinstance(result, bytes):
+                return BytesIO(result)
+            return BytesIO(output_shm.buf[:result])
+        finally:
+            if future.done():
+                self._release(input_shm, output_shm)
+            else:
+                # Cancelled while running, the worker still uses the segments
+                future.add_done_callback(
+                    lambda _: loop.call_soon_threadsafe(self._release, input_shm, output_shm)
+                )
+
+    async def warm_up(self, workers: int, *, delay: float = 0.1) -> float:
+        """Starts every worker of the pool, running its initializer. Returns the time taken."""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, _ping, delay) for _ in range(workers)))
+        return time.perf_counter() - start
+
+    def close(self) -> None:
+        """Frees the idle segments. Segments of running jobs are freed when they finish."""
+        self._closed = True
+        self._release(*self._idle)
+        self._idle.clear()
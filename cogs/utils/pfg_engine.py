@@ -0,0 +1,369 @@
+from __future__ import annotations
+
+from typing import (
+    TYPE_CHECKING,
+    NamedTuple,
+    TypeAlias,
+    Optional,
+    Sequence,
+    Iterable,
+    overload,
+    Literal,
+    Union,
+    Self
+)
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from cogs.pfg import PfgFlags
+
+
+N: TypeAlias = Union[int, float]
+G: TypeAlias = Literal[1, -1, 0]
+shots_to_damage: dict[int, N] = {
+    1: 100,
+    2: 50,
+    3: 33.34,
+    4: 25,
+    5: 20,
+    6: 16.67,
+    7: 14.29,
+    8: 12.5,
+    9: 11.12,
+    10: 10,
+    11: 9.1,
+    12: 8.34,
+}
+
+
+# Thresholds laid out for the vectorized engine, in the same order as `shots_to_damage`
+_THRESHOLD_SHOTS = np.array(tuple(shots_to_damage), dtype=np.int64)
+_THRESHOLD_DAMAGES = np.array(tuple(shots_to_damage.values()), dtype=np.float64)
+_THRESHOLD_ROWS = np.arange(len(shots_to_damage))[:, None]
+
+
+@overload
+def remove_decimal(number: int, ndigits: int = 2) -> int:
+    ...
+
+
+@overload
+def remove_decimal(number: float, ndigits: int = 2) -> N:
+    ...
+
+
+def remove_decimal(number: N, ndigits: int = 2) -> N:
+    if isinstance(number, int):
+        return number
+    elif number.is_integer():
+        return int(number)
+    else:
+        return round(number, ndigits)
+
+
+class PfgPoint(NamedTuple):
+    shots: int
+    range: N
+    ttk: Optional[N]
+
+
+class PfgParams(NamedTuple):
+    damages: Sequence[N]
+    ranges: Sequence[N]
+    multiplier: N = 1
+    rpm: Optional[N] = None
+
+    def canonicalize(self) -> PfgParams:
+        """Returns a hashable copy where equal values compare equal, e.g. ``1`` and ``1.0``."""
+        return PfgParams(
+            tuple(map(float, self.damages)),
+            tuple(map(float, self.ranges)),
+            float(self.multiplier),
+            float(self.rpm) if self.rpm is not None else None,
+        )
+
+
+def _find_crossings(
+    d0: np.ndarray,
+    d1: np.ndarray,
+    r0: np.ndarray,
+    r1: np.ndarray,
+    seg_starts: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Vectorized :meth:`PfgCalculator.evaluate_shots_to_kill` over every threshold at once.
+
+    The segment arrays may hold the segments of several weapons back to back,
+    ``seg_starts`` marks the first segment of each weapon so ``g`` doesn't carry over.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: The ``hits``, ``g`` and ``studs`` arrays,
+            each shaped ``(thresholds, segments)``.
+    """
+    d = _THRESHOLD_DAMAGES[:, None]
+
+    # Check if each threshold is within the y-range of each segment
+    hits = (np.minimum(d0, d1) <= d) & (d <= np.maximum(d0, d1))
+
+    # `g` is only updated by decreasing or increasing segments and otherwise
+    # carries over from the previous hit, so forward fill it from those segments
+    sets_one = hits & (d0 > d1) & (d != d1)
+    sets_zero = hits & (d0 < d1)
+    sets_g = sets_one | sets_zero | seg_starts
+
+    last_set = np.where(sets_g, np.arange(d0.size), 0)
+    np.maximum.accumulate(last_set, axis=1, out=last_set)
+    g = sets_one[_THRESHOLD_ROWS, last_set].astype(np.int64)
+
+    # Same operation order as the scalar version to get the exact same floats
+    with np.errstate(divide='ignore', invalid='ignore'):
+        studs = r0 + (d - d0) * (r1 - r0) / (d1 - d0)
+    studs = np.where(d0 == d1, r0, studs)
+
+    return hits, g, studs
+
+
+class PfgCalculator:
+    shots_to_damage = shots_to_damage
+
+    def __init__(
+        self,
+        damages: Sequence[N],
+        ranges: Sequence[N],
+        multiplier: N,
+        rpm: Optional[N] = None,
+    ):
+        d_len, r_len = len(damages), len(ranges)
+        if d_len != r_len:
+            raise ValueError('Damages and ranges must be the same length.')
+        elif d_len < 2:
+            raise ValueError('At least two data points are required.')
+
+        self.damages: Sequence[N] = damages
+        self.ranges: Sequence[N] = ranges
+        self.multiplier: N = multiplier
+        self.rpm: Optional[N] = rpm
+
+        # Apply multiplier
+        self.damages = [damage * self.multiplier for damage in damages]
+
+        # Create data points
+        self.data_points: Sequence[tuple[N, N]] = tuple(zip(self.damages, self.ranges))
+        self.len_data_points = d_len  # Since damages and ranges are the same length
+
+        # Precompute max values
+        self._max_damage = max(self.damages)
+        self._max_range = max(self.ranges)
+
+    @classmethod
+    def from_pfg_args(cls, args: PfgFlags) -> Self:
+        return cls(args.damages, args.ranges, args.multiplier, args.rpm)  # type: ignore
+
+    @classmethod
+    def from_data_points(
+        cls,
+        data_points: Sequence[tuple[N, N]],
+        *,
+        multiplier: N = 1,
+        rpm: Optional[N] = None,
+    ) -> Self:
+        damages, ranges = zip(*data_points)
+        return cls(damages, ranges, multiplier, rpm)
+
+    @staticmethod
+    def _calculate_ttk(shots: N, rpm: Optional[N] = None) -> Optional[float]:
+        if not rpm:
+            return None
+
+        ttk = 60 * (shots - 1) / rpm
+        ttk = round(ttk, 5)
+        return ttk or None
+
+    def _create_output_data(self, data_points: Sequence[tuple[int, N]]) -> list[PfgPoint]:
+        return [
+            PfgPoint(
+                shots=shots,
+                range=remove_decimal(range_),
+                ttk=self._calculate_ttk(shots=shots, rpm=self.rpm),
+            )
+            for shots, range_ in data_points
+        ]
+
+    def evaluate_damage_to_shots(self, value: N) -> Optional[N]:
+        """Evaluates the damage value to determine the corresponding number of shots needed.
+
+        Args:
+            value (N): The damage value to evaluate.
+
+        Returns:
+            Optional[N]: The number of shots needed to inflict the given damage value.
+                         Returns None if the damage value is less than the minimum damage.
+        """
+
+        # First value
+        prev_damage = self.shots_to_damage[1]
+        if value >= prev_damage:
+            return 1
+
+        # Find which segment x belongs to
+        for i, damage in self.shots_to_damage.items():
+            if prev_damage > value >= damage:
+                return i
+            prev_damage = damage
+
+    def evaluate_shots_to_kill(self, d: N) -> list[tuple[G, N]]:
+        matches = []
+        g: G = 0
+
+        # Iterate over the data points
+        # We skip the last data point to avoid an IndexError
+        for i, data_point in enumerate(self.data_points[:-1]):
+            d0, r0 = data_point
+            d1, r1 = self.data_points[i + 1]
+
+            # Check if y is within the y-range of the current segment
+            if min(d0, d1) <= d <= max(d0, d1):
+
+                # If the graph is decreasing
+                if d0 > d1 and d != d1:
+                    g = 1
+                # If the graph is increasing
+                elif d0 < d1:
+                    g = 0
+
+                # Avoid dividing by zero
+                if d0 != d1:
+                    match = r0 + (d - d0) * (r1 - r0) / (d1 - d0)
+                    matches.append((g, match))
+
+                # If y1 and y2 are equal and x1 is not already in the list,
+                # add x1 to the list
+                elif len(matches) == 0 or r0 != matches[-1]:
+                    matches.append((g, r0))
+
+        return matches
+
+    def _build_progression(self, crossings: Iterable[tuple[int, N]]) -> list[PfgPoint]:
+        progression = []
+
+        # Weapon start
+        first_shots_to_kill = self.evaluate_damage_to_shots(self.damages[0])
+        if first_shots_to_kill is not None:
+            progression.append((first_shots_to_kill, 0))
+
+        # Weapon progression
+        for shots, studs in crossings:
+            point = shots, round(studs, 2)
+            if progression[-1][0] != point[0]:
+                progression.append(point)
+
+        # Sort the list by the ranges
+        progression.sort(key=lambda x: x[1])
+
+        # This is a hack but,
+        # we need to filter out consecutive duplicates where
+        # the first value of a point matches the last one in the list
+        progression = [
+            point
+            for i, point in enumerate(progression)
+            if i == 0 or progression[i - 1][0] != point[0]
+        ]
+
+        # Final step - create the output
+        progression = self._create_output_data(progression)
+
+        return progression
+
+    def calculate_progression(self) -> list[PfgPoint]:
+        # A single weapon is too small for NumPy to pay off, use the batch API for many
+        crossings = (
+            (i + g, studs)
+            for i, damage in self.shots_to_damage.items()
+            for g, studs in self.evaluate_shots_to_kill(damage)
+        )
+        return self._build_progression(crossings)
+
+    @staticmethod
+    def calculate_progressions(calculators: Sequence[PfgCalculator]) -> list[list[PfgPoint]]:
+        """Calculates the progression of many calculators in a single vectorized pass.
+
+        Gives the exact same output as calling :meth:`calculate_progression` on each one.
+
+        Args:
+            calculators (Sequence[PfgCalculator]): The calculators to evaluate.
+
+        Returns:
+            list[list[PfgPoint]]: The progression of each calculator, in the same order.
+        """
+        if not calculators:
+            return []
+
+        # Lay out the segments of every calculator back to back
+        d0, d1, r0, r1, seg_starts, bounds = [], [], [], [], [], []
+        start = 0
+        for calc in calculators:
+            damages, ranges = calc.damages, calc.ranges
+            d0.extend(damages[:-1])
+            d1.extend(damages[1:])
+            r0.extend(ranges[:-1])
+            r1.extend(ranges[1:])
+
+            end = start + calc.len_data_points - 1
+            seg_starts.append(start)
+            bounds.append((start, end))
+            start = end
+
+        starts_mask = np.zeros(start, dtype=np.bool_)
+        starts_mask[seg_starts] = True
+
+        hits, g, studs = _find_crossings(
+            np.array(d0, dtype=np.float64),
+            np.array(d1, dtype=np.float64),
+            np.array(r0, dtype=np.float64),
+            np.array(r1, dtype=np.float64),
+            starts_mask,
+        )
+
+        progressions = []
+        for calc, (start, end) in zip(calculators, bounds):
+            # Row-major order matches iterating thresholds first, then segments
+            rows, cols = np.nonzero(hits[:, start:end])
+            cols += start
+
+            crossings = zip(
+                (_THRESHOLD_SHOTS[rows] + g[rows, cols]).tolist(),
+                studs[rows, cols].tolist(),
+            )
+            progressions.append(calc._build_progression(crossings))
+
+        return progressions
+
+    @classmethod
+    def batch_calculate_progression(
+        cls, configs: Iterable[Union[PfgParams, tuple]]
+    ) -> list[list[PfgPoint]]:
+        """Calculates the progressions of many ``(damages, ranges, multiplier, rpm)`` configs.
+
+        Raises:
+            ValueError: If any of the configs is invalid.
+        """
+        return cls.calculate_progressions([cls(*config) for config in configs])
+
+    def __repr__(self) -> str:
+        return (
+            f'{self.__class__.__name__}('
+            f'damages={self.damages}, '
+            f'ranges={self.ranges}, '
+            f'multiplier={self.multiplier}, '
+            f'rpm={self.rpm})'
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, PfgCalculator):
+            return NotImplemented
+        return (
+            self.damages == other.damages
+            and self.ranges == other.ranges
+            and self.multiplier == other.multiplier
+            and self.rpm == other.rpm
+        )
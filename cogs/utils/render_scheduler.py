@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import time
+import asyncio
+import logging
+from io import BytesIO
+from collections import Counter, OrderedDict, deque
+from typing import Any, NamedTuple, Optional, Union
+
+from discord.ext import commands
+
+from cogs.utils.image_jobs import ImageFunc, ImageJobRunner
+
+logger = logging.getLogger('discord.' + __name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_QUEUE = 32
+DEFAULT_MAX_PER_USER = 2
+
+
+class RenderBusy(commands.CommandError):
+    """Raised when the render queue is full, instead of queueing the job."""
+
+    def __init__(self, message: str = 'I\'m busy rendering other images, try again in a moment.'):
+        super().__init__(message)
+
+
+def _percentile(samples: deque[float], percentile: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile))]
+
+
+class RenderStats(NamedTuple):
+    running: int
+    queued: int
+    peak_queued: int
+    completed: int
+    rejected: int
+    wait_p50: float
+    wait_p95: float
+    run_p50: float
+    run_p95: float
+
+    def __str__(self) -> str:
+        return (
+            f'{self.running} running, {self.queued} queued (peak {self.peak_queued}), '
+            f'{self.completed} done, {self.rejected} rejected\n'
+            f'wait p50/p95 {self.wait_p50 * 1000:.0f}/{self.wait_p95 * 1000:.0f} ms, '
+            f'run p50/p95 {self.run_p50 * 1000:.0f}/{self.run_p95 * 1000:.0f} ms'
+        )
+
+
+class RenderScheduler:
+    """Bot-wide scheduler for image renders in the process pool.
+
+    At most ``workers`` jobs are in the pool at once, the rest wait in per-user
+    queues that are served round robin, so one user spamming a command does not
+    starve everyone else. When ``max_queue`` jobs are waiting, or a user already
+    has ``max_per_user`` jobs pending, new jobs are rejected with :exc:`RenderBusy`.
+    """
+
+    def __init__(
+        self,
+        jobs: ImageJobRunner,
+        *,
+        workers: int = DEFAULT_WORKERS,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        max_per_user: int = DEFAULT_MAX_PER_USER,
+        samples: int = 256,
+    ):
+        self.jobs: ImageJobRunner = jobs
+        self.workers: int = workers
+        self.max_queue: int = max_queue
+        self.max_per_user: int = max_per_user
+
+        self._running: int = 0
+        self._queued: int = 0
+        self._waiting: OrderedDict[int, deque[asyncio.Future[None]]] = OrderedDict()
+        self._pending: Counter[int] = Counter()
+
+        # Metrics
+        self.peak_queued: int = 0
+        self.completed: int = 0
+        self.rejected: int = 0
+        self._wait_times: deque[float] = deque(maxlen=samples)
+        self._run_times: deque[float] = deque(maxlen=samples)
+
+    def _reject(self, message: Optional[str] = None) -> RenderBusy:
+        self.rejected += 1
+        return RenderBusy(message) if message else RenderBusy()
+
+    def _dispatch(self) -> None:
+        """Hands free slots to the waiting jobs, one user at a time."""
+        while self._running < self.workers and self._waiting:
+            user_id, queue = next(iter(self._waiting.items()))
+            waiter = queue.popleft()
+            self._queued -= 1
+
+            if queue:
+                self._waiting.move_to_end(user_id)
+            else:
+                del self._waiting[user_id]
+
+            # Its task is about to see the cancellation
+            if waiter.cancelled():
+                continue
+
+            self._running += 1
+            waiter.set_result(None)
+
+    def _release(self) -> None:
+        self._running -= 1
+        self._dispatch()
+
+    async def _acquire(self, user_id: int) -> None:
+        if self._running < self.workers and not self._queued:
+            self._running += 1
+            return
+
+        if self._queued >= self.max_queue:
+            raise self._reject()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(user_id, deque()).append(waiter)
+        self._queued += 1
+        self.peak_queued = max(self.peak_queued, self._queued)
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Got a slot right as it was cancelled, pass it on
+                self._release()
+            else:
+                queue = self._waiting.get(user_id)
+                if queue is not None and waiter in queue:
+                    queue.remove(waiter)
+                    self._queued -= 1
+                    if not queue:
+                        del self._waiting[user_id]
+            raise
+
+    async def submit(
+        self,
+        user_id: int,
+        func: ImageFunc,
+        data: Union[bytes, bytearray, memoryview],
+        *args: Any,
+        output_size: Optional[int] = None,
+    ) -> BytesIO:
+        """Runs an image job for the user once a worker is free.
+
+        Raises:
+            RenderBusy: The queue is full or the user has too many jobs pending.
+        """
+        if self._pending[user_id] >= self.max_per_user:
+            raise self._reject('You already have images being rendered, wait for them to finish.')
+
+        self._pending[user_id] += 1
+        try:
+            queued_at = time.perf_counter()
+            await self._acquire(user_id)
+
+            started_at = time.perf_counter()
+            self._wait_times.append(started_at - queued_at)
+            try:
+                buffer = await self.jobs.run(func, data, *args, output_size=output_size)
+            finally:
+                self._release()
+
+            self._run_times.append(time.perf_counter() - started_at)
+            self.completed += 1
+            return buffer
+        finally:
+            self._pending[user_id] -= 1
+            if not self._pending[user_id]:
+                del self._pending[user_id]
+
+    @property
+    def stats(self) -> RenderStats:
+        return RenderStats(
+            self._running,
+            self._queued,
+            self.peak_queued,
+            self.completed,
+            self.rejected,
+            _percentile(self._wait_times, 0.5),
+            _percentile(self._wait_times, 0.95),
+            _percentile(self._run_times, 0.5),
+            _percentile(self._run_times, 0.95),
+        )
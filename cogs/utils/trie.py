@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from typing import Iterable
+
+
+class _Node:
+    __slots__ = ('children', 'completions')
+
+    def __init__(self) -> None:
+        self.children: dict[str, _Node] = {}
+        self.completions: list[str] = []
+
+
+class PrefixTrie:
+    """A read-only prefix trie for autocompletion.
+
+    Every node stores its first ``limit`` completions in sorted order when it's built,
+    so a lookup only walks the characters of the prefix.
+    """
+
+    def __init__(self, words: Iterable[str], *, limit: int = 25):
+        self.limit: int = limit
+        self._root = _Node()
+
+        # Inserting in sorted order keeps every node's completions sorted
+        for word in sorted(set(words)):
+            self._insert(word)
+
+    def _insert(self, word: str) -> None:
+        node = self._root
+        if len(node.completions) < self.limit:
+            node.completions.append(word)
+
+        for char in word:
+            node = node.children.setdefault(char, _Node())
+            if len(node.completions) < self.limit:
+                node.completions.append(word)
+
+    def complete(self, prefix: str) -> list[str]:
+        """Returns up to ``limit`` words starting with the prefix."""
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)  # type: ignore
+            if node is None:
+                return []
+        return node.completions.copy()
+
+    def __contains__(self, word: str) -> bool:
+        completions = self.complete(word)
+        return bool(completions) and completions[0] == word
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Generic, Hashable, Optional, TypeVar
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+logger = logging.getLogger('discord.' + __name__)
+
+
+class WriteBehindBuffer(Generic[K, V]):
+    """Coalesces keyed writes in memory and flushes them in batches.
+
+    Meant to keep saves off the command path: :meth:`put` never waits on the store.
+    Only the last write of each key is kept, pending writes are flushed
+    every ``interval`` seconds or as soon as ``max_pending`` keys are waiting.
+    Pending and in-flight values are newer than the store's, readers should check
+    :meth:`get` before reading the store so they never see stale data.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[list[tuple[K, V]]], Awaitable[None]],
+        *,
+        interval: float = 2.0,
+        max_pending: int = 64,
+    ):
+        self._flush = flush
+        self.interval: float = interval
+        self.max_pending: int = max_pending
+
+        self._pending: dict[K, V] = {}
+        self._inflight: dict[K, V] = {}
+        self._full = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._worker: Optional[asyncio.Task[None]] = None
+
+    def start(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    def put(self, key: K, value: V) -> None:
+        self._pending[key] = value
+        if len(self._pending) >= self.max_pending:
+            self._full.set()
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        try:
+            return self._pending[key]
+        except KeyError:
+            return self._inflight.get(key, default)
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._pending:
+                return
+
+            self._inflight, self._pending = self._pending, {}
+            try:
+                await self._flush(list(self._inflight.items()))
+            except Exception:
+                logger.exception('Failed to flush %s pending writes, retrying later.', len(self._inflight))
+                self._requeue_inflight()
+            except asyncio.CancelledError:
+                self._requeue_inflight()
+                raise
+            finally:
+                self._inflight = {}
+
+    def _requeue_inflight(self) -> None:
+        # Newer writes take precedence over the ones that failed
+        self._inflight.update(self._pending)
+        self._pending = self._inflight
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self._full.clear()
+            await self.flush()
+
+    async def close(self) -> None:
+        """Stops the background flushing and flushes anything still pending."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        await self.flush()
+
+    def __len__(self) -> int:
+        return len(self._pending)
@@ -4,7 +4,7 @@ import os
 import asyncio
 import logging
 from datetime import datetime
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
 from concurrent.futures import ProcessPoolExecutor
 
 import discord
@@ -14,9 +14,17 @@ from discord.ext import commands
 import aiohttp
 import asqlite
 
+import config
 from config import TOKEN
+from cogs.utils.avatar_cache import DEFAULT_MAX_BYTES as DEFAULT_AVATAR_CACHE_BYTES, AvatarCache
+from cogs.utils.cache import LRUCache
 from cogs.utils.context import Context
+from cogs.utils.image_cache import DEFAULT_MAX_BYTES, ImageResultCache
+from cogs.utils.image_jobs import IMAGE_MODULES, ImageJobRunner, init_worker
+from cogs.utils.render_scheduler import DEFAULT_MAX_QUEUE, DEFAULT_WORKERS, RenderScheduler
+from cogs.utils.write_buffer import WriteBehindBuffer
 from utils.setup_logging import setup_logging
+from utils.setup_database import DEFAULT_POOL_SIZE, create_pool, setup_db_tables
 
 if TYPE_CHECKING:
     from discord import Interaction, Message
@@ -33,8 +41,13 @@ def _get_prefix(bot, message):
 
 class MoistBot(commands.Bot):
     executor: ProcessPoolExecutor
+    image_jobs: ImageJobRunner
+    render_scheduler: RenderScheduler
     session: aiohttp.ClientSession
     pool: asqlite.Pool
+    schema_versions: dict[str, int]
+    image_cache: ImageResultCache
+    avatar_cache: AvatarCache
 
     def __init__(self):
         allowed_mentions = discord.AllowedMentions(
@@ -60,7 +73,10 @@ class MoistBot(commands.Bot):
         )
         self.started_at: datetime = discord.utils.utcnow()
         self.cooldowns: dict[int, datetime] = {}
+        self.caches: dict[str, LRUCache] = {}
+        self.write_buffers: dict[str, WriteBehindBuffer] = {}
         self.synced: bool = True
+        self._prewarm_task: Optional[asyncio.Task[None]] = None
 
     async def load_cogs(self) -> None:
         for filename in os.listdir('./cogs'):
@@ -71,10 +87,47 @@ class MoistBot(commands.Bot):
                     logger.exception(f'Failed to load extension {filename}\n')
 
     async def setup_hook(self) -> None:
-        self.executor = ProcessPoolExecutor(max_workers=4)
+        # Image renders, every image command goes through the scheduler
+        workers = getattr(config, 'RENDER_WORKERS', DEFAULT_WORKERS)
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, initializer=init_worker, initargs=(IMAGE_MODULES,)
+        )
+        self.image_jobs = ImageJobRunner(self.executor)
+        self.render_scheduler = RenderScheduler(
+            self.image_jobs,
+            workers=workers,
+            max_queue=getattr(config, 'RENDER_MAX_QUEUE', DEFAULT_MAX_QUEUE),
+        )
+
+        # Start the workers in the background instead of on the first render
+        if getattr(config, 'RENDER_PREWARM', True):
+            self._prewarm_task = asyncio.create_task(self._prewarm_workers(workers))
+
         self.session = aiohttp.ClientSession()
+
+        # Generated images, shared by the image commands
+        self.image_cache = ImageResultCache(
+            getattr(config, 'IMAGE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES),
+            directory=getattr(config, 'IMAGE_CACHE_DIR', None),
+        )
+        self.caches['images'] = self.image_cache.memory
+
+        # Avatar bytes, shared by everything that downloads avatars
+        self.avatar_cache = AvatarCache(
+            self.session, getattr(config, 'AVATAR_CACHE_MAX_BYTES', DEFAULT_AVATAR_CACHE_BYTES)
+        )
+        self.caches['avatars'] = self.avatar_cache.cache
+
         await asyncio.create_task(self.load_cogs())
 
+    async def _prewarm_workers(self, workers: int) -> None:
+        try:
+            elapsed = await self.image_jobs.warm_up(workers)
+        except Exception:
+            logger.exception('Failed to pre-warm the render workers')
+        else:
+            logger.info(f'Pre-warmed {workers} render workers in {elapsed:.2f}s')
+
     async def get_context(
         self, origin: Message | Interaction, /, *, cls: Context = Context  # type: ignore
     ) -> Context:
@@ -97,8 +150,13 @@ class MoistBot(commands.Bot):
         await super().start(token=token, reconnect=reconnect)
 
     async def close(self) -> None:
+        # Flush pending writes while the pool is still open
+        for buffer in self.write_buffers.values():
+            await buffer.close()
+
         await super().close()
         self.executor.shutdown()
+        self.image_jobs.close()
         await self.session.close()
         await self.pool.close()
         logger.info('Bot closed.')
@@ -130,33 +188,25 @@ class MoistBot(commands.Bot):
         return __import__('config')
 
 
-async def setup_db_tables(conn: asqlite.Connection) -> None:
-    async with conn:
-        query = """--sql
-            CREATE TABLE
-                IF NOT EXISTS pfg_param_cache (
-                    user_id INTEGER PRIMARY KEY,
-                    damages TEXT DEFAULT '[]', -- JSON array
-                    ranges TEXT DEFAULT '[]', -- JSON array
-                    multiplier REAL DEFAULT 1.0,
-                    rpm REAL
-                )
-        """
-        await conn.execute(query)
-
-
 async def run_bot() -> None:
     with setup_logging():
 
         # Setup database
-        pool = await asqlite.create_pool('moist.db')
+        pool = await create_pool(
+            'moist.db',
+            size=getattr(config, 'DB_POOL_SIZE', DEFAULT_POOL_SIZE),
+            pragmas=getattr(config, 'DB_PRAGMAS', None),
+        )
 
         async with pool.acquire() as conn:
-            await setup_db_tables(conn)
+            schema_versions = await setup_db_tables(
+                conn, pfg_param_blobs=getattr(config, 'PFG_PARAM_BLOBS', False)
+            )
 
         # Start the bot
         async with MoistBot() as client:
             client.pool = pool
+            client.schema_versions = schema_versions
             await client.start()
 
 
@@ -0,0 +1,98 @@
+"""The vectorized pfg engine must give the exact same output as the pure Python one."""
+
+from __future__ import annotations
+
+import random
+from typing import Optional
+
+import numpy as np
+import pytest
+
+from cogs.utils.pfg_engine import PfgCalculator, PfgParams, _find_crossings, shots_to_damage
+
+SEEDS = range(20)
+SAMPLES = 500
+
+
+def _random_value(rng: random.Random, low: float, high: float):
+    # Mix ints, floats and exact threshold hits to cover every branch
+    roll = rng.random()
+    if roll < 0.2:
+        return rng.randint(round(low), round(high))
+    elif roll < 0.35:
+        return rng.choice(tuple(shots_to_damage.values()))
+    return round(rng.uniform(low, high), rng.choice((0, 1, 2, 5)))
+
+
+def random_params(rng: random.Random) -> PfgParams:
+    length = rng.randint(2, 8)
+    damages = []
+    for _ in range(length):
+        # Repeat the previous damage sometimes to get flat segments
+        if damages and rng.random() < 0.15:
+            damages.append(damages[-1])
+        else:
+            damages.append(_random_value(rng, 5, 120))
+
+    ranges = sorted(_random_value(rng, 0, 300) for _ in range(length))
+    multiplier = rng.choice((1, 1.2, 1.5, 2, 0.9, rng.uniform(0.5, 3)))
+    rpm: Optional[float] = rng.choice((None, 600, 857.5, rng.uniform(50, 1500)))
+    return PfgParams(damages, ranges, multiplier, rpm)
+
+
+def _outcome(func):
+    try:
+        return func()
+    except Exception as e:
+        return type(e)
+
+
+def _calculators(seed: int) -> list[PfgCalculator]:
+    rng = random.Random(seed)
+    return [PfgCalculator(*random_params(rng)) for _ in range(SAMPLES)]
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_find_crossings_matches_scalar(seed: int):
+    for calc in _calculators(seed):
+        damages = np.array(calc.damages, dtype=np.float64)
+        ranges = np.array(calc.ranges, dtype=np.float64)
+        seg_starts = np.zeros(len(damages) - 1, dtype=np.bool_)
+        seg_starts[0] = True
+
+        hits, g, studs = _find_crossings(damages[:-1], damages[1:], ranges[:-1], ranges[1:], seg_starts)
+
+        for row, damage in enumerate(shots_to_damage.values()):
+            cols = np.nonzero(hits[row])[0]
+            expected = calc.evaluate_shots_to_kill(damage)
+            actual = list(zip(g[row, cols].tolist(), studs[row, cols].tolist()))
+
+            assert [(flag, float(match)) for flag, match in expected] == actual, (calc, damage)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_calculate_progressions_matches_scalar(seed: int):
+    calcs = _calculators(seed)
+
+    for calc in calcs:
+        expected = _outcome(calc.calculate_progression)
+        actual = _outcome(lambda: PfgCalculator.calculate_progressions([calc])[0])
+
+        # Compare types too, ``1 == 1.0`` is not good enough here
+        assert repr(expected) == repr(actual), calc
+
+    # Evaluating many at once must not mix up the weapons
+    valid = [calc for calc in calcs if not isinstance(_outcome(calc.calculate_progression), type)]
+    batched = PfgCalculator.calculate_progressions(valid)
+    assert repr(batched) == repr([calc.calculate_progression() for calc in valid])
+
+
+def test_batch_calculate_progression():
+    configs = [([30, 20], [40, 80], 1, 600), ([50, 25, 25], [0, 60, 120], 1.2, None)]
+
+    assert PfgCalculator.batch_calculate_progression(configs) == [
+        PfgCalculator(*config).calculate_progression() for config in configs
+    ]
+
+    with pytest.raises(ValueError):
+        PfgCalculator.batch_calculate_progression([([30], [40], 1)])
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import logging
+import sqlite3
+from typing import Any, Optional
+
+import asqlite
+import orjson
+
+from cogs.utils.float_blobs import pack_floats
+
+
+logger = logging.getLogger('discord.' + __name__)
+
+DEFAULT_POOL_SIZE = 10
+
+# Applied to every pooled connection, see https://www.sqlite.org/pragma.html
+DEFAULT_PRAGMAS: dict[str, Any] = {
+    'journal_mode': 'wal',  # Readers don't block the writer and vice versa
+    'synchronous': 'normal',  # Safe with WAL, only the checkpoints fsync
+    'cache_size': -16_000,  # 16 MiB page cache per connection
+    'mmap_size': 256 * 1024 * 1024,  # 256 MiB of memory mapped reads
+    'temp_store': 'memory',
+    'busy_timeout': 5_000,  # Wait on the write lock instead of raising
+}
+
+
+def configure_connection(conn: sqlite3.Connection, pragmas: Optional[dict[str, Any]] = None) -> None:
+    """Applies the pragmas to a connection, overriding the defaults."""
+    pragmas = DEFAULT_PRAGMAS | (pragmas or {})
+    for name, value in pragmas.items():
+        conn.execute(f'PRAGMA {name} = {value}')
+
+
+async def create_pool(
+    database: str,
+    *,
+    size: int = DEFAULT_POOL_SIZE,
+    pragmas: Optional[dict[str, Any]] = None,
+) -> asqlite.Pool:
+    """Creates an asqlite pool with every connection tuned by :func:`configure_connection`."""
+    return await asqlite.create_pool(
+        database, size=size, init=lambda conn: configure_connection(conn, pragmas)
+    )
+
+
+# Latest schema version of each versioned table
+# pfg_param_cache: 1 - damages and ranges as JSON arrays, 2 - as packed float64 blobs
+SCHEMA_VERSIONS: dict[str, int] = {'pfg_param_cache': 2}
+
+
+async def _get_schema_versions(conn: asqlite.Connection) -> dict[str, int]:
+    query = """--sql
+        CREATE TABLE
+            IF NOT EXISTS schema_version (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+    """
+    await conn.execute(query)
+
+    # Tables that predate the version table start at version 1
+    query = """--sql
+        INSERT OR IGNORE INTO schema_version (name, version)
+        VALUES (?, 1)
+    """
+    for name in SCHEMA_VERSIONS:
+        await conn.execute(query, name)
+
+    rows = await conn.fetchall('SELECT name, version FROM schema_version')
+    return {row['name']: row['version'] for row in rows}
+
+
+async def _migrate_pfg_param_blobs(conn: asqlite.Connection) -> None:
+    """Migrates pfg_param_cache from JSON arrays to packed float64 blobs."""
+
+    async with conn.transaction():
+        query = """--sql
+            CREATE TABLE
+                pfg_param_cache_v2 (
+                    user_id INTEGER PRIMARY KEY,
+                    damages BLOB DEFAULT x'', -- float64 array
+                    ranges BLOB DEFAULT x'', -- float64 array
+                    multiplier REAL DEFAULT 1.0,
+                    rpm REAL
+                )
+        """
+        await conn.execute(query)
+
+        rows = await conn.fetchall('SELECT user_id, damages, ranges, multiplier, rpm FROM pfg_param_cache')
+        rows = [
+            (
+                row['user_id'],
+                pack_floats(orjson.loads(row['damages'])),
+                pack_floats(orjson.loads(row['ranges'])),
+                row['multiplier'],
+                row['rpm'],
+            )
+            for row in rows
+        ]
+
+        query = """--sql
+            INSERT INTO pfg_param_cache_v2 (user_id, damages, ranges, multiplier, rpm)
+            VALUES (?, ?, ?, ?, ?)
+        """
+        async with conn.cursor() as cursor:
+            await cursor.executemany(query, rows)
+
+        await conn.execute('DROP TABLE pfg_param_cache')
+        await conn.execute('ALTER TABLE pfg_param_cache_v2 RENAME TO pfg_param_cache')
+        await conn.execute("UPDATE schema_version SET version = 2 WHERE name = 'pfg_param_cache'")
+
+    logger.info(f'Migrated {len(rows)} pfg_param_cache rows to float64 blobs.')
+
+
+async def setup_db_tables(conn: asqlite.Connection, *, pfg_param_blobs: bool = False) -> dict[str, int]:
+    """Creates and migrates the database tables.
+
+    Returns:
+        dict[str, int]: The schema version of each versioned table.
+    """
+    async with conn:
+        query = """--sql
+            CREATE TABLE
+                IF NOT EXISTS pfg_param_cache (
+                    user_id INTEGER PRIMARY KEY,
+                    damages TEXT DEFAULT '[]', -- JSON array
+                    ranges TEXT DEFAULT '[]', -- JSON array
+                    multiplier REAL DEFAULT 1.0,
+                    rpm REAL
+                )
+        """
+        await conn.execute(query)
+
+        query = """--sql
+            CREATE TABLE
+                IF NOT EXISTS guild_settings (
+                    guild_id INTEGER PRIMARY KEY,
+                    petpet_format TEXT DEFAULT 'gif'
+                )
+        """
+        await conn.execute(query)
+
+        versions = await _get_schema_versions(conn)
+
+        # Blobs are opt-in, but once migrated there is no going back
+        if pfg_param_blobs and versions['pfg_param_cache'] < 2:
+            await _migrate_pfg_param_blobs(conn)
+            versions['pfg_param_cache'] = 2
+
+        return versions